@@ -0,0 +1,130 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import router, transaction
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Ограниченный LRU-кэш токенов с временем жизни записей.
+
+    Кэш живёт в памяти процесса, поэтому изменения, сделанные в других
+    процессах, становятся видны не позже чем через TOKEN_CACHE_TTL.
+    Счётчик поколений не даёт сохранить пользователя, прочитанного из
+    базы до инвалидации. В записи лежат значения полей пользователя и
+    токена, а не сами объекты: каждый запрос получает свои экземпляры.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, generation):
+        with self.lock:
+            if generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.generation += 1
+            self.entries.pop(key, None)
+
+    def delete_user(self, user_id):
+        with self.lock:
+            self.generation += 1
+            for key in [key for key, (_, (cached_user_id, *_))
+                        in self.entries.items()
+                        if cached_user_id == user_id]:
+                del self.entries[key]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+            }
+
+
+_cache = None
+_lock = threading.Lock()
+
+
+def get_token_cache():
+    global _cache
+    if _cache is None:
+        with _lock:
+            if _cache is None:
+                _cache = TokenCache(
+                    settings.TOKEN_CACHE_MAX_SIZE, settings.TOKEN_CACHE_TTL)
+    return _cache
+
+
+def invalidate_token(key):
+    cache = get_token_cache()
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def invalidate_user_tokens(user_id):
+    cache = get_token_cache()
+    cache.delete_user(user_id)
+    transaction.on_commit(lambda: cache.delete_user(user_id))
+
+
+def field_values(instance):
+    return tuple(getattr(instance, field.attname)
+                 for field in instance._meta.concrete_fields)
+
+
+def from_field_values(model, values):
+    return model.from_db(router.db_for_read(model), None, [
+        copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+        for value in values
+    ])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Аутентификация по токену без запроса к базе на каждый вызов."""
+
+    def authenticate_credentials(self, key):
+        cache = get_token_cache()
+        cached = cache.get(key)
+        if cached is None:
+            generation = cache.generation
+            user, token = super().authenticate_credentials(key)
+            cached = (user.pk, field_values(user), field_values(token))
+            cache.set(key, cached, generation)
+        _, user_values, token_values = cached
+        user = from_field_values(get_user_model(), user_values)
+        token = from_field_values(self.get_model(), token_values)
+        token.user = user
+        return user, token
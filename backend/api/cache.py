@@ -0,0 +1,82 @@
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.db import transaction
+
+from recipe.models import Recipe
+from .serializers import RecipeSerializer
+
+RECIPE_CACHE_VERSION = 2
+
+
+def recipe_cache_key(pk):
+    return f'recipe:{pk}'
+
+
+def absolute_url(request, url):
+    return request.build_absolute_uri(url) if request and url else url
+
+
+def absolute_variants(request, variants):
+    if not variants:
+        return variants
+    return {
+        variant: {extension: absolute_url(request, url)
+                  for extension, url in urls.items()}
+        for variant, urls in variants.items()
+    }
+
+
+def get_recipes_data(recipes, context):
+    """Сериализует рецепты, общую часть ответа берёт из кэша.
+
+    В кэше хранится представление рецепта для анонимного пользователя
+    с относительными ссылками на файлы: полные адреса, флаги текущего
+    пользователя и счётчики подставляются для каждого запроса.
+    """
+    request = context.get('request')
+    cache = caches['recipes']
+    keys = {recipe.pk: recipe_cache_key(recipe.pk) for recipe in recipes}
+    cached = cache.get_many(keys.values(), version=RECIPE_CACHE_VERSION)
+    missing = [pk for pk, key in keys.items() if key not in cached]
+    if missing:
+        fresh = {
+            recipe_cache_key(item['id']): item
+            for item in RecipeSerializer(
+                Recipe.objects.filter(pk__in=missing).for_feed(
+                    AnonymousUser()),
+                many=True, context={**context, 'request': None}
+            ).data
+        }
+        cache.set_many(fresh, version=RECIPE_CACHE_VERSION)
+        cached.update(fresh)
+    data = []
+    for recipe in recipes:
+        item = cached.get(keys[recipe.pk])
+        if item is None:
+            continue
+        author = item['author']
+        data.append({
+            **item,
+            'image': absolute_url(request, item['image']),
+            'image_variants': absolute_variants(
+                request, item['image_variants']),
+            'author': {
+                **author,
+                'avatar': absolute_url(request, author['avatar']),
+                'avatar_variants': absolute_variants(
+                    request, author['avatar_variants']),
+                'is_subscribed': recipe.is_subscribed_to_author,
+            },
+            'is_favorited': recipe.is_favorited,
+            'is_in_shopping_cart': recipe.is_in_shopping_cart,
+            'favorites_count': recipe.favorites_count,
+            'carts_count': recipe.carts_count,
+        })
+    return data
+
+
+def invalidate_recipes(pks):
+    keys = [recipe_cache_key(pk) for pk in pks]
+    if keys:
+        transaction.on_commit(lambda: caches['recipes'].delete_many(
+            keys, version=RECIPE_CACHE_VERSION))
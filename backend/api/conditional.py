@@ -0,0 +1,25 @@
+import hashlib
+
+from django.utils.cache import (get_conditional_response, patch_vary_headers)
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(
+        ':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def not_modified(request, etag, last_modified=None):
+    return get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=last_modified and int(last_modified.timestamp()),
+    )
+
+
+def set_conditional_headers(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ('Authorization',))
+    return response
@@ -0,0 +1,169 @@
+from django.conf import settings
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+
+from recipe.models import Recipe, Subscription, TimelineEntry, User
+
+BATCH_SIZE = 1000
+
+
+def fans_out(author):
+    """Раскладывать ли новые рецепты автора по лентам подписчиков.
+
+    Рецепты авторов с большим числом подписчиков не копируются в ленты,
+    а выбираются из таблицы рецептов при чтении ленты.
+    """
+    return author.followers_count <= settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def add_to_followers_count(author_ids, delta):
+    """Меняет число подписчиков и дополняет ленты при возврате к раскладке."""
+    User.objects.filter(pk__in=author_ids).update(
+        followers_count=Greatest(F('followers_count') + delta, 0))
+    if delta < 0:
+        max_followers = settings.FEED_FANOUT_MAX_FOLLOWERS
+        refill_timelines(User.objects.filter(
+            pk__in=author_ids,
+            followers_count__lte=max_followers,
+            followers_count__gt=max_followers + delta,
+        ))
+
+
+def trim_timelines(user_ids):
+    """Удаляет из лент записи сверх FEED_MAX_LENGTH.
+
+    Новый рецепт добавляется в каждую ленту одной записью, поэтому
+    лишней после этого может оказаться только самая старая запись.
+    """
+    max_length = settings.FEED_MAX_LENGTH
+    TimelineEntry.objects.filter(pk__in=list(User.objects.filter(
+        pk__in=user_ids
+    ).annotate(
+        overflow=Subquery(TimelineEntry.objects.filter(
+            user=OuterRef('pk')
+        ).order_by('-pub_date').values('pk')[max_length:max_length + 1])
+    ).filter(overflow__isnull=False).values_list('overflow', flat=True))
+    ).delete()
+
+
+def trim_timeline(user):
+    TimelineEntry.objects.filter(pk__in=list(user.timeline.order_by(
+        '-pub_date').values_list('pk', flat=True)[settings.FEED_MAX_LENGTH:])
+    ).delete()
+
+
+def fan_out(recipe):
+    """Добавляет новый рецепт в ленты подписчиков автора.
+
+    Число подписчиков читается из базы под блокировкой строки автора:
+    у recipe.author оно может быть устаревшим, а одновременная отписка
+    дождётся публикации и сама дополнит ленты.
+    """
+    author = User.objects.select_for_update().only(
+        'followers_count').get(pk=recipe.author_id)
+    if not fans_out(author):
+        return
+    follower_ids = list(Subscription.objects.filter(
+        author_id=recipe.author_id).values_list('user', flat=True))
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, recipe=recipe,
+                          pub_date=recipe.pub_date)
+            for user_id in follower_ids
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timelines(follower_ids)
+
+
+def fill_timeline(user, recipes):
+    """Добавляет рецепты в ленту, не трогая вытесненные лимитом."""
+    max_length = settings.FEED_MAX_LENGTH
+    cutoff = user.timeline.order_by('-pub_date').values_list(
+        'pub_date', flat=True)[max_length - 1:max_length].first()
+    if cutoff is not None:
+        recipes = recipes.filter(pub_date__gt=cutoff)
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user=user, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in recipes.order_by(
+                '-pub_date', '-id'
+            ).values_list('pk', 'pub_date')[:max_length]
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim_timeline(user)
+
+
+def backfill_timeline(user, author):
+    """Добавляет в ленту последние рецепты автора после подписки."""
+    if fans_out(author):
+        fill_timeline(user, author.recipes.all())
+
+
+def refill_timelines(authors):
+    """Добавляет рецепты авторов в ленты всех их подписчиков.
+
+    Пока у автора было больше FEED_FANOUT_MAX_FOLLOWERS подписчиков, его
+    новые рецепты в ленты не раскладывались. Когда подписчиков снова
+    становится меньше, в каждую ленту добавляются рецепты автора не старше
+    последнего уже разложенного и новее вытесненных лимитом записей.
+    """
+    max_length = settings.FEED_MAX_LENGTH
+    timeline = TimelineEntry.objects.filter(
+        user=OuterRef('pk')).order_by('-pub_date')
+    for author in authors:
+        recipes = list(author.recipes.order_by('-pub_date', '-id').values_list(
+            'pk', 'pub_date')[:max_length])
+        entries = []
+        overflowed = []
+        for user_id, length, cutoff, last_pub_date in User.objects.filter(
+            followers__author=author
+        ).annotate(
+            length=Subquery(timeline.order_by().values('user').annotate(
+                total=Count('pk')).values('total')),
+            cutoff=Subquery(timeline.values(
+                'pub_date')[max_length - 1:max_length]),
+            last_pub_date=Subquery(timeline.filter(
+                recipe__author=author).values('pub_date')[:1]),
+        ).values_list('pk', 'length', 'cutoff', 'last_pub_date'):
+            added = [
+                TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                              pub_date=pub_date)
+                for recipe_id, pub_date in recipes
+                if (cutoff is None or pub_date > cutoff)
+                and (last_pub_date is None or pub_date >= last_pub_date)
+            ]
+            entries.extend(added)
+            if (length or 0) + len(added) > max_length:
+                overflowed.append(user_id)
+        TimelineEntry.objects.bulk_create(
+            entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+        for user in User.objects.filter(pk__in=overflowed):
+            trim_timeline(user)
+
+
+def rebuild_timeline(user):
+    user.timeline.all().delete()
+    fill_timeline(user, Recipe.objects.filter(author__in=User.objects.filter(
+        authors__user=user,
+        followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    )))
+
+
+def remove_from_timeline(user, author):
+    user.timeline.filter(recipe__author=author).delete()
+
+
+def feed_recipes(queryset, user):
+    """Рецепты из ленты пользователя и от авторов без раскладки."""
+    pulled_authors = User.objects.filter(
+        authors__user=user,
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    )
+    return queryset.filter(
+        Q(pk__in=user.timeline.values('recipe'))
+        | Q(author__in=pulled_authors)
+    )
@@ -1,9 +1,34 @@
-from django.db.models import OuterRef, Exists
+from django.db.models import Count, OuterRef, Exists
 from django_filters import rest_framework
-from recipe.models import ShoppingCart, Favorite, Recipe
+from rest_framework.filters import OrderingFilter
+from recipe.models import ShoppingCart, Favorite, Recipe, RecipeIngredient
+from .search import search_recipes
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    trending = 'trending'
+
+    def filter_queryset(self, request, queryset, view):
+        if request.query_params.get(self.ordering_param) == self.trending:
+            return queryset.filter(trending__isnull=False).order_by(
+                '-trending__score', '-trending__recipe_id')
+        return super().filter_queryset(request, queryset, view)
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        return ordering and [*ordering, '-id']
+
+
+class NumberInFilter(rest_framework.BaseInFilter,
+                     rest_framework.NumberFilter):
+    pass
 
 
 class RecipeFilter(rest_framework.FilterSet):
+    search = rest_framework.CharFilter(method='filter_search')
+    ingredients_all = NumberInFilter(method='filter_ingredients_all')
+    ingredients_any = NumberInFilter(method='filter_ingredients_any')
+    ingredients_none = NumberInFilter(method='filter_ingredients_none')
     is_in_shopping_cart = rest_framework.BooleanFilter(method='filter_is_in_shopping_cart')
     is_favorited = rest_framework.BooleanFilter(method='filter_is_favorited')
 
@@ -11,6 +36,25 @@ class RecipeFilter(rest_framework.FilterSet):
         model = Recipe
         fields = ['name', 'author']
 
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ingredients_all(self, queryset, name, value):
+        ingredient_ids = set(value)
+        return queryset.filter(pk__in=RecipeIngredient.objects.filter(
+            ingredient__in=ingredient_ids
+        ).values('recipe').annotate(
+            matched=Count('ingredient')
+        ).filter(matched=len(ingredient_ids)).values('recipe'))
+
+    def filter_ingredients_any(self, queryset, name, value):
+        return queryset.filter(pk__in=RecipeIngredient.objects.filter(
+            ingredient__in=value).values('recipe'))
+
+    def filter_ingredients_none(self, queryset, name, value):
+        return queryset.exclude(Exists(RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk'), ingredient__in=value)))
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if self.request.user.is_authenticated:
             shopping_cart_subquery = ShoppingCart.objects.filter(
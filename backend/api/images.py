@@ -0,0 +1,154 @@
+import binascii
+import os
+import re
+import tempfile
+from io import BytesIO
+
+import filetype
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+from rest_framework.exceptions import ValidationError
+
+from recipe.models import Recipe
+
+User = get_user_model()
+
+RECIPE_IMAGE_VARIANTS = {
+    'card': ((480, 480), False),
+    'detail': ((1280, 1280), False),
+}
+AVATAR_VARIANTS = {
+    '64': ((64, 64), True),
+    '128': ((128, 128), True),
+}
+IMAGE_FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+UPLOAD_FORMATS = {
+    'JPEG': 'jpg',
+    'MPO': 'jpg',
+    'PNG': 'png',
+    'GIF': 'gif',
+    'WEBP': 'webp',
+}
+BASE64_HEADER = ';base64,'
+BASE64_CHUNK_SIZE = 64 * 1024
+SIGNATURE_SIZE = 8192
+BASE64_WHITESPACE = re.compile(r'\s+')
+IMAGE_FIELDS = {
+    Recipe: ('image', RECIPE_IMAGE_VARIANTS),
+    User: ('avatar', AVATAR_VARIANTS),
+}
+
+
+def render_variant(source, size, crop, image_format, options):
+    if crop:
+        image = ImageOps.fit(source, size, Image.LANCZOS)
+    else:
+        image = source.copy()
+        image.thumbnail(size, Image.LANCZOS)
+    if image_format == 'JPEG' or image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if image_format == 'WEBP' else 'RGB')
+    buffer = BytesIO()
+    image.save(buffer, image_format, **options)
+    return buffer.getvalue()
+
+
+def build_variants(image_file, variants):
+    """Сохраняет уменьшенные копии изображения без метаданных."""
+    directory, filename = os.path.split(image_file.name)
+    stem = os.path.splitext(filename)[0]
+    with image_file.open('rb'), Image.open(image_file) as source:
+        source = ImageOps.exif_transpose(source)
+        files = {}
+        for variant, (size, crop) in variants.items():
+            files[variant] = {}
+            for extension, (image_format, options) in IMAGE_FORMATS.items():
+                files[variant][extension] = default_storage.save(
+                    os.path.join(
+                        directory, 'variants',
+                        f'{stem}_{variant}.{extension}'),
+                    ContentFile(render_variant(
+                        source, size, crop, image_format, options))
+                )
+    return {'source': image_file.name, 'files': files}
+
+
+def delete_variants(stored_variants):
+    for formats in stored_variants.get('files', {}).values():
+        for name in formats.values():
+            default_storage.delete(name)
+
+
+def _decode_base64_chunks(data, start, destination, max_bytes):
+    tail = ''
+    written = 0
+    for offset in range(start, len(data), BASE64_CHUNK_SIZE):
+        chunk = tail + BASE64_WHITESPACE.sub(
+            '', data[offset:offset + BASE64_CHUNK_SIZE])
+        aligned = len(chunk) - len(chunk) % 4
+        chunk, tail = chunk[:aligned], chunk[aligned:]
+        decoded = binascii.a2b_base64(chunk)
+        written += len(decoded)
+        if written > max_bytes:
+            raise ValidationError(
+                f'Размер изображения превышает {max_bytes} байт.')
+        destination.write(decoded)
+    if tail:
+        raise binascii.Error('Incorrect padding')
+
+
+def decode_base64_image(data, name):
+    """Декодирует изображение из base64 во временный файл.
+
+    Строка декодируется частями, размер файла и число пикселей
+    проверяются до полной распаковки изображения, а формат
+    определяется по содержимому, а не по заголовку data URI.
+    """
+    if not isinstance(data, str):
+        raise ValidationError('Ожидается изображение в формате base64.')
+    start = data.find(BASE64_HEADER)
+    start = 0 if start == -1 else start + len(BASE64_HEADER)
+    max_bytes = settings.IMAGE_UPLOAD_MAX_BYTES
+    if (len(data) - start) * 3 // 4 > max_bytes + 2:
+        raise ValidationError(
+            f'Размер изображения превышает {max_bytes} байт.')
+    upload = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR)
+    try:
+        try:
+            _decode_base64_chunks(data, start, upload, max_bytes)
+        except binascii.Error:
+            raise ValidationError('Некорректные данные base64.')
+        upload.seek(0)
+        kind = filetype.guess(upload.read(SIGNATURE_SIZE))
+        if kind is None or kind.extension not in UPLOAD_FORMATS.values():
+            raise ValidationError('Неподдерживаемый формат изображения.')
+        upload.seek(0)
+        max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+        try:
+            with Image.open(upload) as image:
+                width, height = image.size
+                if width * height > max_pixels:
+                    raise Image.DecompressionBombError
+                image_format = image.format
+                image.verify()
+        except Image.DecompressionBombError:
+            raise ValidationError(
+                f'Разрешение изображения превышает {max_pixels} пикселей.')
+        except (OSError, SyntaxError):
+            raise ValidationError('Файл повреждён или не является '
+                                  'изображением.')
+        if UPLOAD_FORMATS.get(image_format) != kind.extension:
+            raise ValidationError('Неподдерживаемый формат изображения.')
+    except ValidationError:
+        upload.close()
+        raise
+    upload.seek(0)
+    return File(upload, name=f'{name}.{kind.extension}')
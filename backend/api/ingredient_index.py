@@ -0,0 +1,98 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from recipe.models import Ingredient
+
+NGRAM_SIZE = 3
+SEARCH_TERMS_SPLIT = re.compile(r'[\s,]+')
+
+
+class IngredientIndex:
+    """Справочник ингредиентов в памяти процесса.
+
+    Названия хранятся в отсортированном массиве: совпадения по началу
+    строки ищутся бинарным поиском, вхождения подстроки — по индексу
+    триграмм с последующей проверкой кандидатов.
+    """
+
+    def __init__(self, ingredients):
+        self.ingredients = sorted(
+            ingredients, key=lambda item: (item['name'].lower(), item['id']))
+        self.names = [item['name'].lower() for item in self.ingredients]
+        self.ngrams = {}
+        for position, name in enumerate(self.names):
+            for start in range(len(name) - NGRAM_SIZE + 1):
+                self.ngrams.setdefault(
+                    name[start:start + NGRAM_SIZE], set()).add(position)
+        self.etag = hashlib.md5(json.dumps(
+            self.ingredients, ensure_ascii=False).encode()).hexdigest()
+        self.built_at = time.monotonic()
+
+    def prefix_range(self, prefix):
+        start = bisect_left(self.names, prefix)
+        end = start
+        while end < len(self.names) and self.names[end].startswith(prefix):
+            end += 1
+        return range(start, end)
+
+    def substring_positions(self, substring):
+        if len(substring) < NGRAM_SIZE:
+            candidates = range(len(self.names))
+        else:
+            candidates = set.intersection(*(
+                self.ngrams.get(substring[start:start + NGRAM_SIZE], set())
+                for start in range(len(substring) - NGRAM_SIZE + 1)
+            ))
+        return {
+            position for position in candidates
+            if substring in self.names[position]
+        }
+
+    def search(self, name='', search=''):
+        name = name.lower()
+        terms = [term for term in SEARCH_TERMS_SPLIT.split(search.lower())
+                 if term]
+        if terms:
+            positions = [
+                position for position in self.prefix_range(terms[0])
+                if all(self.names[position].startswith(term)
+                       for term in terms[1:])
+                and name in self.names[position]
+            ]
+        elif name:
+            prefix = self.prefix_range(name)
+            positions = list(prefix) + sorted(
+                self.substring_positions(name).difference(prefix))
+        else:
+            positions = range(len(self.ingredients))
+        return [self.ingredients[position] for position in positions]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    global _index
+    index = _index
+    if index is not None and (
+        time.monotonic() - index.built_at
+        < settings.INGREDIENT_INDEX_TTL
+    ):
+        return index
+    with _lock:
+        if _index is index:
+            _index = IngredientIndex(
+                Ingredient.objects.values('id', 'name', 'measurement_unit'))
+        return _index
+
+
+def invalidate_ingredient_index(**kwargs):
+    global _index
+    _index = None
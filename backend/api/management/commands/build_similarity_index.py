@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.similarity import build_index, get_similarity_index, index_state
+
+
+class Command(BaseCommand):
+    help = 'Построение индекса похожих рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Перестроить индекс, даже если рецепты не менялись',
+        )
+
+    def handle(self, *args, **options):
+        index = get_similarity_index()
+        if (not options['force'] and index is not None
+                and index.state == index_state()):
+            self.stdout.write('Рецепты не менялись, индекс актуален.')
+            return
+        indexed = build_index(settings.SIMILARITY_INDEX_PATH)
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс похожих рецептов построен! Рецептов: {indexed}'))
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from api.trending import update_scores
+
+
+class Command(BaseCommand):
+    help = 'Расчёт популярности рецептов с затуханием по времени'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Пересчитать баллы всех рецептов по всем событиям',
+        )
+        parser.add_argument(
+            '--lag',
+            type=int,
+            default=60,
+            help='Не учитывать события моложе стольких секунд',
+        )
+
+    def handle(self, *args, **options):
+        updated, created = update_scores(
+            full=options['full'], lag=timedelta(seconds=options['lag']))
+        self.stdout.write(self.style.SUCCESS(
+            'Популярность рецептов пересчитана! '
+            f'Обновлено: {updated}, добавлено: {created}'
+        ))
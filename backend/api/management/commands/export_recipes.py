@@ -0,0 +1,91 @@
+import base64
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipe.models import Recipe, RecipeIngredient
+
+
+def recipe_record(recipe, inline_images):
+    record = {
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'author': recipe.author.username,
+        'ingredients': [
+            {
+                'name': recipe_ingredient.ingredient.name,
+                'measurement_unit':
+                    recipe_ingredient.ingredient.measurement_unit,
+                'amount': recipe_ingredient.amount,
+            }
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        ],
+    }
+    if inline_images:
+        with recipe.image.open('rb') as image:
+            record['image_base64'] = base64.b64encode(image.read()).decode()
+    else:
+        record['image'] = recipe.image.name
+    return record
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка рецептов в формате NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default='-',
+            help='Файл для выгрузки; по умолчанию стандартный вывод',
+        )
+        parser.add_argument(
+            '--inline-images',
+            action='store_true',
+            help='Встраивать изображения в base64 вместо путей к файлам',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Число рецептов, читаемых из базы за один раз',
+        )
+
+    def handle(self, *args, **options):
+        file = (sys.stdout if options['path'] == '-'
+                else open(options['path'], 'w', encoding='utf-8'))
+        exported = skipped = 0
+        last_pk = 0
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient').order_by('pk'),
+            )
+        ).order_by('pk')
+        try:
+            while True:
+                batch = list(queryset.filter(
+                    pk__gt=last_pk)[:options['batch_size']])
+                if not batch:
+                    break
+                for recipe in batch:
+                    try:
+                        record = recipe_record(
+                            recipe, options['inline_images'])
+                    except OSError:
+                        skipped += 1
+                        continue
+                    file.write(
+                        json.dumps(record, ensure_ascii=False) + '\n')
+                    exported += 1
+                last_pk = batch[-1].pk
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Рецепты выгружены! Записей: {exported}, '
+            f'пропущено без изображения: {skipped}'))
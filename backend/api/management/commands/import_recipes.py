@@ -0,0 +1,172 @@
+import json
+import os
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from rest_framework.exceptions import ValidationError
+
+from api.images import decode_base64_image
+from api.search import update_search_vectors
+from api.trending import create_scores
+from recipe.models import Ingredient, Recipe, RecipeIngredient
+
+User = get_user_model()
+
+
+def init_worker():
+    if not apps.ready:
+        django.setup()
+    for worker_connection in connections.all():
+        # Соединение унаследовано от родительского процесса: закрывать
+        # его нельзя, процесс откроет своё при первом запросе.
+        worker_connection.connection = None
+
+
+def store_image(image):
+    """Сохраняет изображение рецепта и возвращает имя файла в хранилище."""
+    kind, value = image
+    try:
+        if kind == 'base64':
+            image_file = decode_base64_image(value, uuid.uuid4().hex)
+        elif os.path.isabs(value):
+            image_file = File(open(value, 'rb'))
+        else:
+            image_file = File(default_storage.open(value))
+        with image_file:
+            return default_storage.save(
+                Recipe._meta.get_field('image').generate_filename(
+                    None, os.path.basename(image_file.name)),
+                image_file,
+            )
+    except (ValidationError, OSError):
+        return None
+
+
+def image_source(record):
+    if 'image_base64' in record:
+        return 'base64', record['image_base64']
+    return 'path', record.get('image', '')
+
+
+class Command(BaseCommand):
+    help = 'Загрузка рецептов из NDJSON-файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='NDJSON-файл с рецептами')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Число рецептов, сохраняемых одной транзакцией',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов для обработки изображений',
+        )
+
+    def create_recipes(self, recipes):
+        if connection.features.can_return_rows_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            return
+        for recipe in recipes:
+            recipe.save()
+
+    def build_recipe(self, record, image, authors, ingredients):
+        """Собирает рецепт и суммы ингредиентов из записи.
+
+        Поля проверяются валидаторами моделей, которые bulk_create не
+        вызывает. Если запись загрузить нельзя, возвращает None.
+        """
+        try:
+            recipe = Recipe(
+                author_id=authors[record['author']],
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=image,
+            )
+            recipe.clean_fields(exclude=['author', 'image'])
+            recipe_amounts = Counter()
+            for ingredient in record['ingredients']:
+                recipe_ingredient = RecipeIngredient(
+                    amount=ingredient['amount'])
+                recipe_ingredient.clean_fields(
+                    exclude=['recipe', 'ingredient'])
+                recipe_amounts[ingredients[(
+                    ingredient['name'], ingredient['measurement_unit']
+                )]] += recipe_ingredient.amount
+        except (KeyError, TypeError, DjangoValidationError):
+            return None
+        if not recipe_amounts:
+            return None
+        return recipe, recipe_amounts
+
+    def import_batch(self, batch, images, ingredients):
+        authors = dict(User.objects.filter(
+            username__in={record.get('author') for record in batch
+                          if isinstance(record.get('author'), str)}
+        ).values_list('username', 'pk'))
+        recipes = []
+        amounts = []
+        for record, image in zip(batch, images):
+            built = image and self.build_recipe(
+                record, image, authors, ingredients)
+            if not built:
+                if image is not None:
+                    default_storage.delete(image)
+                continue
+            recipes.append(built[0])
+            amounts.append(built[1])
+        with transaction.atomic():
+            self.create_recipes(recipes)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient_id=ingredient_id, amount=amount)
+                for recipe, recipe_amounts in zip(recipes, amounts)
+                for ingredient_id, amount in recipe_amounts.items()
+            )
+            update_search_vectors(recipe.pk for recipe in recipes)
+            create_scores(recipes)
+        return len(recipes)
+
+    def handle(self, *args, **options):
+        ingredients = {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'pk', 'name', 'measurement_unit')
+        }
+        imported = skipped = 0
+        try:
+            file = open(options['path'], encoding='utf-8')
+        except OSError as error:
+            raise CommandError(error)
+        with file, ProcessPoolExecutor(
+            max_workers=options['workers'], initializer=init_worker
+        ) as pool:
+            records = (json.loads(line) for line in file if line.strip())
+            while batch := list(islice(records, options['batch_size'])):
+                images = list(pool.map(
+                    store_image,
+                    [image_source(record) for record in batch],
+                    chunksize=32,
+                ))
+                batch_imported = self.import_batch(batch, images, ingredients)
+                imported += batch_imported
+                skipped += len(batch) - batch_imported
+        self.stdout.write(self.style.SUCCESS(
+            f'Рецепты загружены! Добавлено: {imported}, '
+            f'пропущено: {skipped}. Для создания копий изображений '
+            'запустите process_images.'
+        ))
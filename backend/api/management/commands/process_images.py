@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from api.images import IMAGE_FIELDS
+from api.tasks import process_image
+
+
+class Command(BaseCommand):
+    help = 'Создание уменьшенных копий изображений рецептов и аватаров'
+
+    def handle(self, *args, **kwargs):
+        processed = 0
+        for model, (field_name, _) in IMAGE_FIELDS.items():
+            for pk in model.objects.exclude(
+                **{field_name: ''}
+            ).exclude(
+                **{field_name: None}
+            ).values_list('pk', flat=True).iterator():
+                process_image(model, pk)
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображения обработаны! Проверено записей: {processed}'))
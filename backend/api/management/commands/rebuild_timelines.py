@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.feed import rebuild_timeline
+from recipe.models import TimelineEntry, User
+
+
+class Command(BaseCommand):
+    help = 'Заполнение лент подписок по текущим подпискам'
+
+    def handle(self, *args, **options):
+        TimelineEntry.objects.filter(user__followers__isnull=True).delete()
+        users = User.objects.filter(followers__isnull=False).distinct()
+        for user in users.order_by('pk').iterator():
+            with transaction.atomic():
+                rebuild_timeline(user)
+        self.stdout.write(self.style.SUCCESS(
+            'Ленты подписок заполнены! '
+            f'Записей: {TimelineEntry.objects.count()}'
+        ))
@@ -1,6 +1,81 @@
-from rest_framework.pagination import LimitOffsetPagination
+import json
 
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.settings import api_settings
 
-class PageToOffsetPagination(LimitOffsetPagination):
+
+def estimate_count(queryset):
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class EstimatedCountPaginator(Paginator):
+
+    @cached_property
+    def count(self):
+        threshold = settings.PAGINATION_ESTIMATE_COUNT_THRESHOLD
+        if threshold:
+            estimate = estimate_count(self.object_list)
+            if estimate is not None and estimate > threshold:
+                return estimate
+        return super().count
+
+
+class KeysetPagination(CursorPagination):
+
+    def __init__(self, ordering, page_size):
+        self.ordering = ordering
+        self.page_size = page_size
+
+
+class PageToOffsetPagination(PageNumberPagination):
     page_size = 6
-    page_size_query_param = 'page'
+    page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    cursor_exclusive_params = (api_settings.ORDERING_PARAM,
+                               api_settings.SEARCH_PARAM)
+    django_paginator_class = EstimatedCountPaginator
+    keyset_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.cursor_query_param not in request.query_params:
+            return super().paginate_queryset(queryset, request, view)
+        conflicts = {
+            param: f'Нельзя использовать вместе с {self.cursor_query_param}.'
+            for param in self.cursor_exclusive_params
+            if param in request.query_params
+        }
+        if conflicts:
+            raise ValidationError(conflicts)
+        self.keyset_paginator = KeysetPagination(
+            getattr(view, 'cursor_ordering', ('-id',)),
+            self.get_page_size(request),
+        )
+        return self.keyset_paginator.paginate_queryset(
+            queryset, request, view)
+
+    def get_page_state(self):
+        """Части ответа страницы, которые не выводятся из её записей."""
+        if self.keyset_paginator:
+            return (self.keyset_paginator.get_next_link(),
+                    self.keyset_paginator.get_previous_link())
+        page = getattr(self, 'page', None)
+        return () if page is None else (page.paginator.count,)
+
+    def get_paginated_response(self, data):
+        if self.keyset_paginator:
+            return self.keyset_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
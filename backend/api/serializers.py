@@ -1,16 +1,60 @@
+import uuid
+
 from rest_framework import serializers
 from collections import Counter
-from recipe.models import (Ingredient, Recipe, RecipeIngredient, Favorite, ShoppingCart)
+from recipe.models import (Ingredient, Recipe, RecipeIngredient, Favorite,
+                           ShoppingCart, ShoppingCartIngredient)
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import transaction
 from djoser.serializers import UserSerializer
-from drf_extra_fields.fields import Base64ImageField
+
+from .feed import fan_out
+from .images import (AVATAR_VARIANTS, IMAGE_FORMATS, RECIPE_IMAGE_VARIANTS,
+                     decode_base64_image)
 
 User = get_user_model()
 
 
+class Base64ImageField(serializers.ImageField):
+
+    def to_internal_value(self, data):
+        if data in ('', None):
+            return None
+        return decode_base64_image(data, uuid.uuid4().hex)
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+
+    def __init__(self, image_field, variants, **kwargs):
+        self.image_field = image_field
+        self.variants = variants
+        super().__init__(source='*', **kwargs)
+
+    def to_representation(self, instance):
+        image = getattr(instance, self.image_field)
+        if not image:
+            return None
+        stored = getattr(instance, f'{self.image_field}_variants')
+        files = stored.get('files', {}) if (
+            stored.get('source') == image.name) else {}
+        request = self.context.get('request')
+        variants = {}
+        for variant in self.variants:
+            variants[variant] = {}
+            for extension in IMAGE_FORMATS:
+                url = (default_storage.url(files[variant][extension])
+                       if variant in files else image.url)
+                variants[variant][extension] = (
+                    request.build_absolute_uri(url) if request else url)
+        return variants
+
+
 class UsersSerializer(UserSerializer):
     is_subscribed = serializers.SerializerMethodField()
     avatar = Base64ImageField(required=False, allow_null=True)
+    avatar_variants = ImageVariantsField('avatar', AVATAR_VARIANTS)
 
     class Meta:
         model = User
@@ -21,10 +65,13 @@ class UsersSerializer(UserSerializer):
             'first_name',
             'last_name', 
             'is_subscribed', 
-            'avatar'
+            'avatar',
+            'avatar_variants'
         )
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         user = self.context['request'].user
         if user.is_authenticated:
             return user.followers.filter(author=author).exists()
@@ -40,9 +87,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
 
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(),
-    )
+    id = serializers.IntegerField(source='ingredient_id')
     name = serializers.CharField(
         source='ingredient.name',
         read_only=True
@@ -70,6 +115,14 @@ class SubscriptionRecipeSerializer(serializers.ModelSerializer):
                   'cooking_time')
 
 
+class BulkIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_ACTION_MAX_IDS,
+    )
+
+
 class RecipeSerializer(serializers.ModelSerializer):
 
     author = UsersSerializer(read_only=True)
@@ -78,6 +131,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = Base64ImageField(allow_null=True)
+    image_variants = ImageVariantsField('image', RECIPE_IMAGE_VARIANTS)
     cooking_time = serializers.IntegerField(min_value=1)
 
     class Meta:
@@ -89,15 +143,19 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_favorited',
             'is_in_shopping_cart', 
             'name', 'image', 
+            'image_variants',
             'text', 
-            'cooking_time'
+            'cooking_time',
+            'favorites_count',
+            'carts_count'
         )
 
     def validate_ingredients(self, ingredients):
         if not ingredients:
             raise serializers.ValidationError(
                 'Необходимо добавить хотя бы один ингредиент.')
-        ingredient_ids = [ingredient['id'] for ingredient in ingredients]
+        ingredient_ids = [
+            ingredient['ingredient_id'] for ingredient in ingredients]
         duplicate_ingredients = [
             ingredient_id for ingredient_id,
             count in Counter(ingredient_ids).items() if count > 1
@@ -107,6 +165,18 @@ class RecipeSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 f'Ингредиенты с id {duplicate_ingredients} повторяются.')
 
+        existing_ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        missing_ingredients = [
+            ingredient_id for ingredient_id in ingredient_ids
+            if ingredient_id not in existing_ingredients
+        ]
+        if missing_ingredients:
+            raise serializers.ValidationError(
+                f'Ингредиенты с id {missing_ingredients} не существуют.')
+
+        for ingredient in ingredients:
+            ingredient['ingredient'] = existing_ingredients[
+                ingredient['ingredient_id']]
         return ingredients
 
     def validate_image(self, image):
@@ -115,12 +185,19 @@ class RecipeSerializer(serializers.ModelSerializer):
                 'Необходимо добавить фото.')
         return image
 
+    def validate(self, data):
+        if 'recipe_ingredients' not in data:
+            raise serializers.ValidationError({
+                'ingredients': 'Необходимо добавить хотя бы один ингредиент.'
+            })
+        return data
+
     @staticmethod
     def save_ingredients(recipe, ingredients_data):
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=ingredient['id'],
+                ingredient=ingredient['ingredient'],
                 amount=ingredient.get('amount')
             )
             for ingredient in ingredients_data
@@ -128,23 +205,66 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients')
-        recipe = super().create(validated_data)
-        self.save_ingredients(recipe, ingredients_data)
+        with transaction.atomic():
+            recipe = super().create(validated_data)
+            self.save_ingredients(recipe, ingredients_data)
+            fan_out(recipe)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients_data):
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.recipe_ingredients.all()
+        }
+        new = {
+            ingredient['ingredient_id']: ingredient
+            for ingredient in ingredients_data
+        }
+        removed_ids = existing.keys() - new.keys()
+        added = [
+            ingredient for ingredient_id, ingredient in new.items()
+            if ingredient_id not in existing
+        ]
+        changed = []
+        for ingredient_id, recipe_ingredient in existing.items():
+            if (ingredient_id in new
+                    and recipe_ingredient.amount
+                    != new[ingredient_id]['amount']):
+                recipe_ingredient.amount = new[ingredient_id]['amount']
+                changed.append(recipe_ingredient)
+        if not (removed_ids or added or changed):
+            return
+
+        cart_user_ids = list(
+            recipe.shopping_carts.values_list('user', flat=True))
+        ShoppingCartIngredient.objects.remove_recipe(cart_user_ids, recipe)
+        if removed_ids:
+            recipe.recipe_ingredients.filter(
+                ingredient_id__in=removed_ids).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if added:
+            self.save_ingredients(recipe, added)
+        ShoppingCartIngredient.objects.add_recipe(cart_user_ids, recipe)
+
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('recipe_ingredients', None)
-        validated_ingredients = self.validate_ingredients(ingredients_data)
-        instance.recipe_ingredients.all().delete()
-        self.save_ingredients(instance, validated_ingredients)
-        return super().update(instance, validated_data)
+        ingredients_data = validated_data.pop('recipe_ingredients')
+        with transaction.atomic():
+            self.update_ingredients(instance, ingredients_data)
+            if 'image' in validated_data and instance.image:
+                instance.image.delete(save=False)
+            return super().update(instance, validated_data)
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context['request'].user
         return user.is_authenticated and Favorite.objects.filter(
             user=user, recipe=recipe).exists()
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context['request'].user
         return user.is_authenticated and ShoppingCart.objects.filter(
             user=user, recipe=recipe).exists()
@@ -152,8 +272,7 @@ class RecipeSerializer(serializers.ModelSerializer):
 
 class UserWithRecipesSerializer(UsersSerializer):
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.IntegerField(
-        source='recipes.count', read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -166,12 +285,10 @@ class UserWithRecipesSerializer(UsersSerializer):
             'is_subscribed', 
             'recipes', 
             'recipes_count', 
-            'avatar'
+            'avatar',
+            'avatar_variants'
         )
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        recipes_limit = request.query_params.get('recipes_limit', 10**10)
         return SubscriptionRecipeSerializer(
-            obj.recipes.all()[:int(recipes_limit)], many=True,
-            context=self.context).data
+            obj.limited_recipes, many=True, context=self.context).data
@@ -0,0 +1,110 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from recipe.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                           ShoppingCartIngredient)
+from .authentication import invalidate_token, invalidate_user_tokens
+from .cache import invalidate_recipes
+from .feed import add_to_followers_count
+from .images import IMAGE_FIELDS, delete_variants
+from .ingredient_index import invalidate_ingredient_index
+from .search import update_search_vectors
+from .trending import create_scores
+from .tasks import schedule_image_processing
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(**kwargs):
+    invalidate_ingredient_index()
+
+
+@receiver((post_save, pre_delete), sender=Ingredient)
+def ingredient_recipes_changed(instance, **kwargs):
+    recipes = instance.recipes.all()
+    recipe_ids = list(recipes.values_list('pk', flat=True))
+    invalidate_recipes(recipe_ids)
+    recipes.update(updated_at=timezone.now())
+    transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    invalidate_recipes([instance.pk])
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_published(instance, created, **kwargs):
+    if created:
+        create_scores([instance])
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_search_changed(instance, **kwargs):
+    recipe_ids = [instance.pk]
+    transaction.on_commit(lambda: update_search_vectors(recipe_ids))
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, **kwargs):
+    if not created:
+        invalidate_recipes(instance.recipes.values_list('pk', flat=True))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_changed(instance, **kwargs):
+    if (instance.image
+            and instance.image_variants.get('source') != instance.image.name):
+        schedule_image_processing(Recipe, instance.pk)
+
+
+@receiver(post_save, sender=User)
+def avatar_changed(instance, **kwargs):
+    source = instance.avatar_variants.get('source')
+    if instance.avatar and source != instance.avatar.name:
+        schedule_image_processing(User, instance.pk)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def image_owner_deleted(sender, instance, **kwargs):
+    field_name = IMAGE_FIELDS[sender][0]
+    image_file = getattr(instance, field_name)
+    if image_file:
+        image_file.delete(save=False)
+    delete_variants(getattr(instance, f'{field_name}_variants'))
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_removed_from_carts(instance, **kwargs):
+    ShoppingCartIngredient.objects.remove_recipe(
+        instance.shopping_carts.values_list('user', flat=True), instance)
+
+
+@receiver(pre_delete, sender=User)
+def user_counters_released(instance, **kwargs):
+    for model in (Favorite, ShoppingCart):
+        Recipe.objects.filter(pk__in=model.objects.filter(
+            user=instance
+        ).exclude(
+            recipe__author=instance
+        ).values('recipe')).add_to_counter(model.counter_field, -1)
+    author_ids = list(instance.followers.values_list('author', flat=True))
+    instance.followers.all().delete()
+    add_to_followers_count(author_ids, -1)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def user_tokens_changed(instance, created, **kwargs):
+    if not created:
+        invalidate_user_tokens(instance.pk)
@@ -0,0 +1,172 @@
+import heapq
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.models import Count, F, Max, Sum
+
+from recipe.models import Recipe, RecipeIngredient
+
+MAGIC = b'RSIM1\n'
+HEADER = struct.Struct('<I')
+ARRAYS = (
+    ('recipe_ids', 'q'),
+    ('recipe_offsets', 'q'),
+    ('recipe_terms', 'q'),
+    ('recipe_norms', 'd'),
+    ('term_ids', 'q'),
+    ('term_weights', 'd'),
+    ('posting_offsets', 'q'),
+    ('postings', 'q'),
+)
+
+
+def index_state():
+    """Отпечаток рецептов и их состава, по которому индекс устаревает."""
+    state = Recipe.objects.order_by().aggregate(
+        count=Count('pk'),
+        last_id=Max('pk'),
+        updated_at=Max('updated_at'),
+    )
+    state['ingredients'] = RecipeIngredient.objects.aggregate(
+        checksum=Sum(F('recipe_id') * F('ingredient_id')))['checksum']
+    return json.loads(json.dumps(state, default=str))
+
+
+def build_index(path):
+    """Строит индекс сходства рецептов и атомарно заменяет файл.
+
+    Рецепт — разреженный вектор из ингредиентов с весами IDF. В файле
+    лежат массивы в духе CSR: ингредиенты каждого рецепта и обратные
+    списки рецептов для каждого ингредиента. Индекс строится целиком:
+    любой новый рецепт меняет веса IDF, а с ними нормы всех векторов.
+    """
+    state = index_state()
+    recipe_terms = {}
+    for recipe_id, ingredient_id in RecipeIngredient.objects.order_by(
+            'recipe_id', 'ingredient_id').values_list(
+            'recipe_id', 'ingredient_id').iterator():
+        recipe_terms.setdefault(recipe_id, []).append(ingredient_id)
+    recipe_ids = sorted(recipe_terms)
+    postings = {}
+    for position, recipe_id in enumerate(recipe_ids):
+        for ingredient_id in recipe_terms[recipe_id]:
+            postings.setdefault(ingredient_id, []).append(position)
+    term_ids = sorted(postings)
+    weights = {
+        ingredient_id: math.log(len(recipe_ids) / len(postings[ingredient_id]))
+        for ingredient_id in term_ids
+    }
+    arrays = {name: array(code) for name, code in ARRAYS}
+    arrays['recipe_ids'].extend(recipe_ids)
+    arrays['recipe_offsets'].append(0)
+    for recipe_id in recipe_ids:
+        terms = recipe_terms[recipe_id]
+        arrays['recipe_terms'].extend(terms)
+        arrays['recipe_offsets'].append(len(arrays['recipe_terms']))
+        arrays['recipe_norms'].append(math.sqrt(sum(
+            weights[ingredient_id] ** 2 for ingredient_id in terms)))
+    arrays['term_ids'].extend(term_ids)
+    arrays['posting_offsets'].append(0)
+    for ingredient_id in term_ids:
+        arrays['term_weights'].append(weights[ingredient_id])
+        arrays['postings'].extend(postings[ingredient_id])
+        arrays['posting_offsets'].append(len(arrays['postings']))
+    header = json.dumps({
+        'state': state,
+        'lengths': {name: len(arrays[name]) for name, _ in ARRAYS},
+    }).encode()
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+        file.write(MAGIC + HEADER.pack(len(header)) + header)
+        for name, _ in ARRAYS:
+            arrays[name].tofile(file)
+    os.chmod(file.name, 0o644)
+    os.replace(file.name, path)
+    return len(recipe_ids)
+
+
+class SimilarityIndex:
+    """Индекс сходства, отображённый в память процесса."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(file.fileno())
+        self.version = (stat.st_ino, stat.st_mtime_ns)
+        view = memoryview(self.buffer)
+        offset = len(MAGIC)
+        (header_size,) = HEADER.unpack_from(self.buffer, offset)
+        offset += HEADER.size
+        header = json.loads(bytes(view[offset:offset + header_size]))
+        self.state = header['state']
+        offset += header_size
+        for name, code in ARRAYS:
+            size = header['lengths'][name] * array(code).itemsize
+            setattr(self, name, view[offset:offset + size].cast(code))
+            offset += size
+
+    @staticmethod
+    def find(sorted_ids, value):
+        position = bisect_left(sorted_ids, value)
+        if position < len(sorted_ids) and sorted_ids[position] == value:
+            return position
+        return None
+
+    def similar(self, ingredient_ids, exclude=None, limit=6):
+        """Возвращает id рецептов, ближайших по косинусной мере."""
+        query = {}
+        for ingredient_id in set(ingredient_ids):
+            term = self.find(self.term_ids, ingredient_id)
+            if term is not None and self.term_weights[term]:
+                query[term] = self.term_weights[term]
+        query_norm = math.sqrt(sum(
+            weight ** 2 for weight in query.values()))
+        if not query_norm:
+            return []
+        scores = {}
+        for term, weight in query.items():
+            for position in self.postings[
+                    self.posting_offsets[term]:
+                    self.posting_offsets[term + 1]]:
+                scores[position] = scores.get(position, 0) + weight * weight
+        excluded = (self.find(self.recipe_ids, exclude)
+                    if exclude is not None else None)
+        scores.pop(excluded, None)
+        best = heapq.nlargest(
+            limit, scores.items(),
+            key=lambda item: (
+                item[1] / (query_norm * self.recipe_norms[item[0]]),
+                self.recipe_ids[item[0]],
+            ),
+        )
+        return [self.recipe_ids[position] for position, _ in best]
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_similarity_index():
+    global _index
+    path = settings.SIMILARITY_INDEX_PATH
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    index = _index
+    if index is not None and index.version == (
+            stat.st_ino, stat.st_mtime_ns):
+        return index
+    with _lock:
+        if _index is index:
+            _index = SimilarityIndex(path)
+        return _index
@@ -0,0 +1,79 @@
+import hashlib
+import os
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from recipe.models import StoredFile
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хеш его содержимого.
+
+    Одинаковые загрузки сохраняются на диск один раз, а число ссылок
+    на файл хранится в StoredFile: файл удаляется, только когда на
+    него не остаётся ссылок.
+    """
+
+    prefix = 'sha256'
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        return posixpath.join(
+            self.prefix, digest[:2], digest[2:4],
+            digest + os.path.splitext(name)[1].lower()
+        )
+
+    def add_reference(self, name):
+        referenced = StoredFile.objects.filter(name=name).update(
+            references=F('references') + 1)
+        if referenced:
+            return
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, references=1)
+        except IntegrityError:
+            StoredFile.objects.filter(name=name).update(
+                references=F('references') + 1)
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        self.add_reference(name)
+        if not self.exists(name):
+            saved_name = super()._save(name, content)
+            if saved_name != name:
+                super().delete(saved_name)
+        return name
+
+    def delete(self, name):
+        released = StoredFile.objects.filter(
+            name=name, references__gt=1
+        ).update(references=F('references') - 1)
+        if released:
+            return
+        deleted, _ = StoredFile.objects.filter(name=name).delete()
+        if not deleted:
+            super().delete(name)
+            return
+        transaction.on_commit(lambda: self.delete_unreferenced(name))
+
+    def delete_unreferenced(self, name):
+        """Удаляет файл, если на него так и не появилось новых ссылок.
+
+        Пока файл удаляется, имя занято записью с нулём ссылок. Параллельное
+        сохранение того же файла ждёт на уникальном имени конца этой
+        транзакции, а потом видит, что файла нет, и записывает его заново.
+        Если запись уже создана другим сохранением, файл остаётся.
+        """
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(name=name, references=0)
+                super().delete(name)
+                StoredFile.objects.filter(name=name).delete()
+        except IntegrityError:
+            pass
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from recipe.models import Recipe
+from .cache import invalidate_recipes
+from .images import IMAGE_FIELDS, build_variants, delete_variants
+
+_executor = None
+
+
+def process_image(model, pk):
+    field_name, variants = IMAGE_FIELDS[model]
+    variants_field = f'{field_name}_variants'
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return
+    image_file = getattr(instance, field_name)
+    stored_variants = getattr(instance, variants_field)
+    if not image_file or stored_variants.get('source') == image_file.name:
+        return
+    new_variants = build_variants(image_file, variants)
+    updated = model.objects.filter(
+        pk=pk, **{field_name: image_file.name}
+    ).update(**{variants_field: new_variants, 'updated_at': timezone.now()})
+    if not updated:
+        delete_variants(new_variants)
+        return
+    delete_variants(stored_variants)
+    if model is Recipe:
+        invalidate_recipes([pk])
+    else:
+        invalidate_recipes(instance.recipes.values_list('pk', flat=True))
+
+
+def run_image_job(model, pk):
+    try:
+        process_image(model, pk)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(model, pk):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            thread_name_prefix='images',
+        )
+    transaction.on_commit(lambda: _executor.submit(run_image_job, model, pk))
@@ -1,3 +1,290 @@
-# from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from recipe.models import Ingredient, Recipe, RecipeIngredient, User
+from .authentication import CachedTokenAuthentication
+from .feed import fan_out
+
+SEEDED_RECIPES = 100_000
+TEST_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recipes': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'test-recipes',
+        'OPTIONS': settings.CACHES['recipes'].get('OPTIONS', {}),
+    },
+}
+
+
+def create_author(username='author'):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        password='Secret-Pass-123', first_name='Имя', last_name='Фамилия')
+
+
+def create_recipes(author, count, batch_size=5000, first_id=None):
+    return Recipe.objects.bulk_create(
+        (Recipe(id=first_id and first_id + number,
+                name=f'Рецепт {number}', text='Описание', author=author,
+                image='recipes/images/test.png', cooking_time=10)
+         for number in range(count)),
+        batch_size=batch_size,
+    )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeNameFilterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(create_author(), 12)
+
+    def test_name_filter_matches_whole_name(self):
+        response = APIClient().get('/api/recipes/', {'name': 'Рецепт 1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['name'] for recipe in response.data['results']],
+            ['Рецепт 1'])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeListQueryCountTests(TestCase):
+    cold_queries = 5
+    warm_queries = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = create_author('reader')
+        create_recipes(create_author(), 600)
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {number}', measurement_unit='г')
+            for number in range(3))
+        ingredients = list(Ingredient.objects.all())
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in Recipe.objects.all()
+            for ingredient in ingredients)
+
+    def assert_list_queries(self, client):
+        for page_size in (6, 60, 600):
+            with self.subTest(page_size=page_size):
+                caches['recipes'].clear()
+                for queries in (self.cold_queries, self.warm_queries):
+                    with self.assertNumQueries(queries):
+                        response = client.get(
+                            '/api/recipes/', {'limit': page_size})
+                    self.assertEqual(len(response.data['results']), page_size)
+                    self.assertEqual(
+                        len(response.data['results'][0]['ingredients']), 3)
+
+    def test_anonymous_list_queries(self):
+        self.assert_list_queries(APIClient())
+
+    def test_authenticated_list_queries(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        self.assert_list_queries(client)
+
+
+def client_for(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ListETagTests(TestCase):
+    """Наборы флагов и счётчиков с равными суммами id дают разные ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_author()
+        cls.reader = create_author('reader')
+        cls.others = [create_author(f'other{number}') for number in range(2)]
+        create_recipes(cls.author, 3, first_id=1)
+
+    def assert_changed(self, client, path, change):
+        etag = client.get(path)['ETag']
+        change()
+        response = client.get(path, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response
+
+    def test_recipe_flags(self):
+        client = client_for(self.reader)
+        client.post('/api/recipes/3/favorite/')
+
+        def change():
+            client.delete('/api/recipes/3/favorite/')
+            client.post('/api/recipes/1/favorite/')
+            client.post('/api/recipes/2/favorite/')
+
+        response = self.assert_changed(client, '/api/recipes/', change)
+        self.assertEqual(
+            {recipe['id']: recipe['is_favorited']
+             for recipe in response.data['results']},
+            {1: True, 2: True, 3: False})
+
+    def test_recipe_counters(self):
+        for user in self.others:
+            client_for(user).post('/api/recipes/1/favorite/')
+
+        def change():
+            for user in self.others:
+                client_for(user).delete('/api/recipes/1/favorite/')
+            client_for(self.reader).post('/api/recipes/2/favorite/')
+
+        self.assert_changed(APIClient(), '/api/recipes/', change)
+
+    def test_user_subscriptions(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com',
+            password='Secret-Pass-123', first_name='Имя', last_name='Фамилия')
+        client = client_for(admin)
+        users = sorted(
+            User.objects.exclude(pk=admin.pk), key=lambda user: user.pk)
+        client.post(f'/api/users/{users[0].pk}/subscribe/')
+        client.post(f'/api/users/{users[1].pk}/subscribe/')
+
+        def change():
+            client.delete(f'/api/users/{users[0].pk}/subscribe/')
+            client.delete(f'/api/users/{users[1].pk}/subscribe/')
+            client.post(f'/api/users/{users[2].pk}/subscribe/')
+
+        self.assert_changed(client, '/api/users/', change)
+
+
+@override_settings(CACHES=TEST_CACHES,
+                   ALLOWED_HOSTS=['internal', 'foodgram.example.com'])
+class RecipeCacheUrlTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(create_author(), 1)
+
+    def test_urls_follow_each_request(self):
+        for host, secure in (('internal:8000', False),
+                             ('foodgram.example.com', True)):
+            with self.subTest(host=host):
+                response = APIClient().get(
+                    '/api/recipes/', HTTP_HOST=host, secure=secure)
+                recipe = response.data['results'][0]
+                base = f'{"https" if secure else "http"}://{host}/media/'
+                self.assertTrue(recipe['image'].startswith(base))
+                self.assertTrue(all(
+                    url.startswith(base)
+                    for urls in recipe['image_variants'].values()
+                    for url in urls.values()))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeCursorPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(create_author(), 3)
+
+    def test_cursor_pages(self):
+        response = APIClient().get(
+            '/api/recipes/', {'cursor': '', 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 2)
+        response = APIClient().get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_cursor_rejects_ordering_and_search(self):
+        for params in ({'ordering': '-favorites_count'},
+                       {'ordering': 'trending'},
+                       {'search': 'Рецепт'}):
+            with self.subTest(params=params):
+                response = APIClient().get(
+                    '/api/recipes/', {'cursor': '', **params})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(list(response.data), list(params))
+
+
+@override_settings(CACHES=TEST_CACHES, FEED_FANOUT_MAX_FOLLOWERS=1)
+class FeedFanoutThresholdTests(TestCase):
+
+    def setUp(self):
+        self.author = create_author()
+        self.reader = create_author('reader')
+        self.other = create_author('other')
+        for follower in (self.reader, self.other):
+            self.client_for(follower).post(
+                f'/api/users/{self.author.pk}/subscribe/')
+        create_recipes(self.author, 2)
+
+    def client_for(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client
+
+    def assert_feed_complete(self):
+        response = self.client_for(self.reader).get('/api/recipes/feed/')
+        self.assertEqual(
+            sorted(recipe['name'] for recipe in response.data['results']),
+            ['Рецепт 0', 'Рецепт 1'])
+        self.assertEqual(self.reader.timeline.count(), 2)
+
+    def test_unsubscribe_refills_timelines(self):
+        self.client_for(self.other).delete(
+            f'/api/users/{self.author.pk}/subscribe/')
+        self.assert_feed_complete()
+
+    def test_follower_deletion_refills_timelines(self):
+        self.other.delete()
+        self.assert_feed_complete()
+
+    def test_fan_out_reads_current_followers_count(self):
+        stale_author = User.objects.get(pk=self.author.pk)
+        self.client_for(self.other).delete(
+            f'/api/users/{self.author.pk}/subscribe/')
+        recipe = Recipe.objects.create(
+            name='Новый рецепт', text='Описание', author=stale_author,
+            image='recipes/images/test.png', cooking_time=10)
+        fan_out(recipe)
+        self.assertTrue(self.reader.timeline.filter(recipe=recipe).exists())
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def test_each_request_gets_own_user(self):
+        token = Token.objects.create(user=create_author())
+        authentication = CachedTokenAuthentication()
+        first, _ = authentication.authenticate_credentials(token.key)
+        first.avatar_variants['small'] = 'users/images/changed.webp'
+        first.first_name = 'Другое имя'
+        with self.assertNumQueries(0):
+            second, second_token = authentication.authenticate_credentials(
+                token.key)
+        self.assertIsNot(first, second)
+        self.assertEqual(second.avatar_variants, {})
+        self.assertEqual(second.first_name, 'Имя')
+        self.assertIs(second_token.user, second)
+        self.assertFalse(second._state.adding)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'EXPLAIN проверяется только на PostgreSQL')
+class RecipeNameIndexTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        create_recipes(create_author(), SEEDED_RECIPES)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recipe_recipe')
+
+    def test_name_filter_uses_index(self):
+        plan = Recipe.objects.filter(name='Рецепт 4242').explain()
+        self.assertIn('Index', plan)
+        self.assertIn('recipe_name_idx', plan)
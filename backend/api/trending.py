@@ -0,0 +1,92 @@
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from recipe.models import Favorite, Recipe, RecipeScore, ShoppingCart
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+PUBLISH_WEIGHT = 1.0
+EVENT_WEIGHTS = (
+    (Favorite, 1.0),
+    (ShoppingCart, 2.0),
+)
+BATCH_SIZE = 1000
+
+
+def event_score(weight, happened_at):
+    """Логарифм веса события, приведённого к моменту EPOCH.
+
+    Вклад события затухает с периодом полураспада
+    TRENDING_HALF_LIFE_HOURS. Вместо того чтобы уменьшать баллы всех
+    рецептов со временем, более поздние события получают
+    экспоненциально больший вес: порядок рецептов при этом тот же, а
+    пересчитывать нужно только рецепты с новыми событиями.
+    """
+    decay = math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 60 * 60)
+    return (math.log(weight)
+            + decay * (happened_at - EPOCH).total_seconds())
+
+
+def log_add(first, second):
+    if first is None:
+        return second
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def create_scores(recipes):
+    RecipeScore.objects.bulk_create(
+        [
+            RecipeScore(recipe_id=recipe.pk,
+                        score=event_score(PUBLISH_WEIGHT, recipe.pub_date))
+            for recipe in recipes
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def update_scores(full=False, lag=timedelta(minutes=1)):
+    """Добавляет к баллам события, накопившиеся с прошлого расчёта."""
+    until = timezone.now() - lag
+    scores = {}
+    if full:
+        since = None
+        for recipe_id, pub_date in Recipe.objects.values_list(
+                'pk', 'pub_date').iterator():
+            scores[recipe_id] = event_score(PUBLISH_WEIGHT, pub_date)
+    else:
+        since = RecipeScore.objects.aggregate(
+            since=Max('computed_at'))['since']
+    for model, weight in EVENT_WEIGHTS:
+        events = model.objects.filter(created_at__lte=until)
+        if since is not None:
+            events = events.filter(created_at__gt=since)
+        for recipe_id, created_at in events.values_list(
+                'recipe_id', 'created_at').iterator():
+            scores[recipe_id] = log_add(
+                scores.get(recipe_id), event_score(weight, created_at))
+    with transaction.atomic():
+        if full:
+            RecipeScore.objects.all().delete()
+        existing = RecipeScore.objects.in_bulk(scores)
+        for recipe_score in existing.values():
+            recipe_score.score = log_add(
+                recipe_score.score, scores.pop(recipe_score.pk))
+            recipe_score.computed_at = until
+        RecipeScore.objects.bulk_update(
+            existing.values(), ['score', 'computed_at'],
+            batch_size=BATCH_SIZE)
+        RecipeScore.objects.bulk_create(
+            [
+                RecipeScore(recipe_id=recipe_id, score=score,
+                            computed_at=until)
+                for recipe_id, score in scores.items()
+            ],
+            batch_size=BATCH_SIZE,
+        )
+    return len(existing), len(scores)
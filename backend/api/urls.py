@@ -4,7 +4,7 @@ from django.urls import include, path
 
 
 from .views import (RecipeViewSet, IngredientViewSet,
-                     UserViewSet)
+                    TokenCacheStatsView, UserViewSet)
 
 
 router = routers.DefaultRouter()
@@ -14,5 +14,7 @@ router.register(r'users', UserViewSet, basename='users')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('auth/token-cache/', TokenCacheStatsView.as_view(),
+         name='token-cache'),
     path('auth/', include('djoser.urls.authtoken'))
 ]
@@ -1,23 +1,32 @@
+import csv
+
 from django.utils.timezone import now
 
 
-def render_shopping_cart(ingredients):
+class Echo:
+    def write(self, value):
+        return value
+
 
+def render_shopping_cart(ingredients, recipes):
     today = now().strftime("%d.%m.%Y")
-    header = f'Список покупок\nДата: {today}\n'
-    product_list = [(
-        f'{i}. {ingredient["name"].capitalize()} — {ingredient["amount"]}'
-        f'{ingredient["measurement_unit"]}')
-        for i, ingredient in enumerate(ingredients, 1)
-    ]
-    recipe_set = {ingredient['recipe_name'] for ingredient in ingredients}
+    yield f'Список покупок\nДата: {today}\n\n'
+    yield 'Ингредиенты:\n'
+    for i, ingredient in enumerate(ingredients, 1):
+        yield (
+            f'{i}. {ingredient["name"].capitalize()} — {ingredient["amount"]}'
+            f'{ingredient["measurement_unit"]}\n')
+    yield '\nРецепты:\n'
+    for recipe in recipes:
+        yield f'{recipe}\n'
 
-    recipe_list = ['Рецепты:'] + list(recipe_set)
 
-    return '\n'.join([
-        header,
-        "Ингредиенты:",
-        *product_list,
-        "",
-        *recipe_list
-    ])
+def render_shopping_cart_csv(ingredients, recipes):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единица измерения', 'Количество'))
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            ingredient['amount'],
+        ))
@@ -1,79 +1,199 @@
-import base64
 
-from rest_framework import viewsets, status, filters, serializers
+from rest_framework import viewsets, status, serializers
 from rest_framework.decorators import action
-from rest_framework.permissions import (IsAuthenticated, IsAuthenticatedOrReadOnly)
+from rest_framework.permissions import (IsAdminUser, IsAuthenticated,
+                                        IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
 from rest_framework.exceptions import ValidationError
+from rest_framework.views import APIView
 
-from django.core.files.base import ContentFile
-from django.contrib.auth import get_user_model
-from django.http import FileResponse
-from django.db.models import F, Sum
+from django.conf import settings
+from django.contrib.auth import authenticate, get_user_model
+from django.http import StreamingHttpResponse
+from django.db import transaction
+from django.db.models import (BooleanField, Count, Exists, F, OuterRef,
+                              Prefetch, Subquery, Sum, Value)
 from django.shortcuts import get_object_or_404, redirect
 from django_filters.rest_framework import DjangoFilterBackend
 from django.urls import reverse
+from django.utils.cache import patch_cache_control
 from djoser.views import UserViewSet as DjoserUserViewSet
+from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
-from recipe.models import (Ingredient, Recipe, Favorite, ShoppingCart, RecipeIngredient)
+from recipe.models import (Ingredient, Recipe, Favorite,
+                           ShoppingCart, ShoppingCartIngredient,
+                           Subscription)
 from .serializers import (
-    UsersSerializer, UserWithRecipesSerializer,
+    BulkIdsSerializer, UsersSerializer, UserWithRecipesSerializer,
     RecipeSerializer, IngredientSerializer, SubscriptionRecipeSerializer
 )
+from .authentication import get_token_cache
+from .cache import get_recipes_data
+from .feed import (add_to_followers_count, backfill_timeline, feed_recipes,
+                   fill_timeline, remove_from_timeline)
+from .conditional import make_etag, not_modified, set_conditional_headers
 from .permissions import IsAuthorOrReadOnly
-from .filters import RecipeFilter
-from .pagination import PageToOffsetPagination
-from .utils import render_shopping_cart
+from .filters import RecipeFilter, RecipeOrderingFilter
+from .pagination import KeysetPagination, PageToOffsetPagination
+from .renderers import CSVShoppingCartRenderer, TextShoppingCartRenderer
+from .utils import render_shopping_cart, render_shopping_cart_csv
+from .images import decode_base64_image, delete_variants
+from .ingredient_index import get_ingredient_index
+from .similarity import get_similarity_index
 
 User = get_user_model()
 
+SHOPPING_CART_RENDERERS = {
+    TextShoppingCartRenderer.format: render_shopping_cart,
+    CSVShoppingCartRenderer.format: render_shopping_cart_csv,
+}
+
+
+def bulk_ids(request):
+    serializer = BulkIdsSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    return list(dict.fromkeys(serializer.validated_data['ids']))
+
+
+def recipe_state(recipe):
+    """Всё, от чего зависит представление рецепта для пользователя."""
+    return (recipe.pk, recipe.updated_at, recipe.author_updated_at,
+            recipe.is_favorited, recipe.is_in_shopping_cart,
+            recipe.is_subscribed_to_author, recipe.favorites_count,
+            recipe.carts_count)
+
+
+def page_etag(request, paginator, rows):
+    """ETag страницы по самим её записям, а не по сводке всей выборки."""
+    state = paginator.get_page_state() if paginator else ()
+    return make_etag(request.get_full_path(), request.user.pk, *state, *rows)
+
+
+def bulk_results(ids, statuses):
+    return Response({'results': [
+        {'id': pk, 'status': statuses.get(pk, 'not_found')} for pk in ids
+    ]})
+
 
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
-    filter_backends = (DjangoFilterBackend, filters.SearchFilter,)
-    search_fields = ('^name',)
 
-    def get_queryset(self):
-        queryset = Ingredient.objects.all().order_by('name')
-        name = self.request.query_params.get('name', None)
-        if name:
-            queryset = queryset.filter(name__icontains=name)
-        return queryset
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if response.status_code in (status.HTTP_200_OK,
+                                    status.HTTP_304_NOT_MODIFIED):
+            patch_cache_control(
+                response, public=True,
+                max_age=settings.INGREDIENTS_CACHE_MAX_AGE)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        index = get_ingredient_index()
+        name = request.query_params.get('name', '')
+        search = request.query_params.get('search', '')
+        etag = make_etag(index.etag, name, search)
+        return (
+            not_modified(request, etag)
+            or set_conditional_headers(
+                Response(index.search(name=name, search=search)), etag)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        etag = make_etag(
+            get_ingredient_index().etag, kwargs[self.lookup_field])
+        return (
+            not_modified(request, etag)
+            or set_conditional_headers(
+                super().retrieve(request, *args, **kwargs), etag)
+        )
 
 
 class RecipeViewSet(viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     pagination_class = PageToOffsetPagination
-    filter_backends = (DjangoFilterBackend,)
+    cursor_ordering = ('-pub_date', '-id')
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('favorites_count',)
     permission_classes = (IsAuthorOrReadOnly,)
 
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve', 'similar', 'feed'):
+            return Recipe.objects.with_user_flags(
+                self.request.user
+            ).annotate(author_updated_at=F('author__updated_at'))
+        return Recipe.objects.for_feed(self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+        etag = page_etag(request, self.paginator,
+                         [recipe_state(recipe) for recipe in recipes])
+        response = not_modified(request, etag)
+        if response:
+            return response
+        data = get_recipes_data(recipes, self.get_serializer_context())
+        if page is not None:
+            response = self.get_paginated_response(data)
+        else:
+            response = Response(data)
+        return set_conditional_headers(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        etag = make_etag(request.user.pk, recipe_state(recipe))
+        return (
+            not_modified(request, etag)
+            or set_conditional_headers(
+                Response(get_recipes_data(
+                    [recipe], self.get_serializer_context())[0]),
+                etag)
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def get_permissions(self):
         if self.action == 'create':
             return [IsAuthenticated()]
-        return [IsAuthorOrReadOnly(), IsAuthenticatedOrReadOnly()]
+        if self.action in ('list', 'retrieve', 'update',
+                           'partial_update', 'destroy'):
+            return [IsAuthorOrReadOnly(), IsAuthenticatedOrReadOnly()]
+        return super().get_permissions()
 
     @staticmethod
     def handle_recipe_action(model, user, action_type, pk):
         recipe = get_object_or_404(Recipe, pk=pk)
         if action_type == 'add':
-            obj, created = model.objects.get_or_create(user=user, recipe=recipe)
-            if not created:
-                raise serializers.ValidationError('Рецепт уже добавлен.')
+            with transaction.atomic():
+                obj, created = model.objects.get_or_create(
+                user=user, recipe=recipe)
+                if not created:
+                    raise serializers.ValidationError('Рецепт уже добавлен.')
+                Recipe.objects.filter(pk=recipe.pk).add_to_counter(
+                    model.counter_field, 1)
+                if model is ShoppingCart:
+                    ShoppingCartIngredient.objects.add_recipe(
+                        [user.pk], recipe)
             return Response(SubscriptionRecipeSerializer(recipe).data, status=status.HTTP_201_CREATED)
         
         elif action_type == 'remove':
-            get_object_or_404(
-                model,
-                user=user,
-                recipe=recipe
-            ).delete()
+            with transaction.atomic():
+                get_object_or_404(
+                    model,
+                    user=user,
+                    recipe=recipe
+                ).delete()
+                Recipe.objects.filter(pk=recipe.pk).add_to_counter(
+                    model.counter_field, -1)
+                if model is ShoppingCart:
+                    ShoppingCartIngredient.objects.remove_recipe(
+                        [user.pk], recipe)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post'], permission_classes=[IsAuthenticated])
@@ -81,7 +201,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return self.handle_recipe_action(
             ShoppingCart,
             request.user,
-            'add')
+            'add',
+            pk)
     
     @shopping_cart.mapping.delete
     def remove_from_shopping_cart(self, request, pk=None):
@@ -104,33 +225,165 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def remove_from_favorites(self, request, pk=None):
         return self.handle_recipe_action(Favorite, request.user, 'remove', pk)
 
+    @staticmethod
+    def handle_bulk_recipe_action(model, request):
+        user = request.user
+        ids = bulk_ids(request)
+        recipes = dict(Recipe.objects.filter(pk__in=ids).annotate(
+            added=Exists(model.objects.filter(
+                user=user, recipe=OuterRef('pk')))
+        ).values_list('pk', 'added'))
+        if request.method == 'POST':
+            changed = [pk for pk, added in recipes.items() if not added]
+            statuses = {pk: 'exists' for pk in recipes}
+            statuses.update(dict.fromkeys(changed, 'added'))
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    [model(user=user, recipe_id=pk) for pk in changed],
+                    ignore_conflicts=True)
+                Recipe.objects.filter(pk__in=changed).add_to_counter(
+                    model.counter_field, 1)
+                if model is ShoppingCart and changed:
+                    ShoppingCartIngredient.objects.add_recipes(
+                        user.pk, changed)
+        else:
+            changed = [pk for pk, added in recipes.items() if added]
+            statuses = {pk: 'not_added' for pk in recipes}
+            statuses.update(dict.fromkeys(changed, 'removed'))
+            with transaction.atomic():
+                model.objects.filter(user=user, recipe__in=changed).delete()
+                Recipe.objects.filter(pk__in=changed).add_to_counter(
+                    model.counter_field, -1)
+                if model is ShoppingCart and changed:
+                    ShoppingCartIngredient.objects.remove_recipes(
+                        user.pk, changed)
+        return bulk_results(ids, statuses)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart', permission_classes=[IsAuthenticated])
+    def bulk_shopping_cart(self, request):
+        return self.handle_bulk_recipe_action(ShoppingCart, request)
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite', permission_classes=[IsAuthenticated])
+    def bulk_favorite(self, request):
+        return self.handle_bulk_recipe_action(Favorite, request)
+
     @action(detail=True, methods=['get'], url_path='get-link')
     def get_link(self, request, pk=None):
         short_link = request.build_absolute_uri(reverse('recipe_redirect', args=[recipe.pk]))
         return Response({'short-link': short_link}, status=status.HTTP_200_OK)
 
+    def get_similar_limit(self):
+        limit = self.request.query_params.get('limit')
+        if limit is None:
+            return settings.SIMILAR_RECIPES_LIMIT
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= settings.SIMILAR_RECIPES_MAX_LIMIT:
+            raise ValidationError({'limit': (
+                'Должно быть целым числом от 1 до '
+                f'{settings.SIMILAR_RECIPES_MAX_LIMIT}.')})
+        return limit
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        recipe = self.get_object()
+        limit = self.get_similar_limit()
+        index = get_similarity_index()
+        if index is None:
+            return Response([])
+        ids = index.similar(
+            recipe.recipe_ingredients.values_list('ingredient_id', flat=True),
+            exclude=recipe.pk, limit=limit)
+        recipes = self.get_queryset().in_bulk(ids)
+        return Response(get_recipes_data(
+            [recipes[pk] for pk in ids if pk in recipes],
+            self.get_serializer_context()))
+
     @action(detail=False, permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        paginator = KeysetPagination(
+            self.cursor_ordering, self.paginator.get_page_size(request))
+        page = paginator.paginate_queryset(
+            feed_recipes(self.get_queryset(), request.user), request, self)
+        return paginator.get_paginated_response(
+            get_recipes_data(page, self.get_serializer_context()))
+
+    @action(detail=False, permission_classes=[IsAuthenticated],
+            renderer_classes=[TextShoppingCartRenderer,
+                              CSVShoppingCartRenderer])
     def download_shopping_cart(self, request):
         user = request.user
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in=user.shopping_carts.values('recipe')
-        ).values(
+        ingredients = user.shopping_cart_ingredients.values(
             name=F('ingredient__name'),
             measurement_unit=F('ingredient__measurement_unit'),
-            recipe_name=F('recipe__name')
         ).annotate(amount=Sum('amount')).order_by('name')
+        recipes = user.shopping_carts.values_list(
+            'recipe__name', flat=True).order_by('recipe__name')
 
-        return FileResponse(
-            render_shopping_cart(ingredients), 
-            as_attachment=True,
-            filename='Shopping_cart.txt',
-            content_type='text/plain'
+        file_format = request.accepted_renderer.format
+        render = SHOPPING_CART_RENDERERS[file_format]
+        response = StreamingHttpResponse(
+            render(ingredients.iterator(), recipes.iterator()),
+            content_type=(f'{request.accepted_renderer.media_type}; '
+                          f'charset={request.accepted_renderer.charset}')
         )
+        response['Content-Disposition'] = (
+            f'attachment; filename="Shopping_cart.{file_format}"')
+        return response
+
 
 class UserViewSet(DjoserUserViewSet):
     queryset = User.objects.all()
     serializer_class = UsersSerializer
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    pagination_class = PageToOffsetPagination
+    cursor_ordering = ('username',)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_subscribed=Value(False, output_field=BooleanField()))
+        return queryset.annotate(is_subscribed=Exists(
+            Subscription.objects.filter(user=user, author=OuterRef('pk'))))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        users = list(queryset) if page is None else page
+        etag = page_etag(request, self.paginator, [
+            (user.pk, user.updated_at, user.is_subscribed) for user in users
+        ])
+        response = not_modified(request, etag)
+        if response:
+            return response
+        data = self.get_serializer(users, many=True).data
+        if page is not None:
+            response = self.get_paginated_response(data)
+        else:
+            response = Response(data)
+        return set_conditional_headers(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        user = self.get_object()
+        etag = make_etag(user.pk, request.user.pk, user.updated_at,
+                         getattr(user, 'is_subscribed', False))
+        last_modified = None
+        if not request.user.is_authenticated:
+            last_modified = user.updated_at
+        return (
+            not_modified(request, etag, last_modified)
+            or set_conditional_headers(
+                Response(self.get_serializer(user).data),
+                etag, last_modified)
+        )
 
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
@@ -149,8 +402,14 @@ class UserViewSet(DjoserUserViewSet):
                     {'error': 'Нельзя подписаться на самого себя.'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            subscription, created = user.followers.get_or_create(
-                author=author)
+            subscriptions = self.get_subscriptions_queryset()
+            with transaction.atomic():
+                subscription, created = user.followers.get_or_create(
+                    author=author)
+                if created:
+                    add_to_followers_count([author.pk], 1)
+                    author.refresh_from_db(fields=['followers_count'])
+                    backfill_timeline(user, author)
 
             if not created:
                 return Response(
@@ -158,27 +417,100 @@ class UserViewSet(DjoserUserViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             serializer = UserWithRecipesSerializer(
-                author, context={'request': request}
+                subscriptions.get(pk=author.pk),
+                context={'request': request}
             )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
-        get_object_or_404(user.followers, author=author).delete()
+        with transaction.atomic():
+            get_object_or_404(user.followers, author=author).delete()
+            add_to_followers_count([author.pk], -1)
+            remove_from_timeline(user, author)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='subscribe', permission_classes=[IsAuthenticated])
+    def bulk_subscribe(self, request):
+        user = request.user
+        ids = bulk_ids(request)
+        authors = {
+            pk: (subscribed, followers_count)
+            for pk, subscribed, followers_count in User.objects.filter(
+                pk__in=ids
+            ).annotate(subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('pk')))
+            ).values_list('pk', 'subscribed', 'followers_count')
+        }
+        if request.method == 'POST':
+            changed = [pk for pk, (subscribed, _) in authors.items()
+                       if not subscribed and pk != user.pk]
+            statuses = {pk: 'exists' for pk in authors}
+            statuses.update(dict.fromkeys(changed, 'subscribed'))
+            if user.pk in authors:
+                statuses[user.pk] = 'self'
+            with transaction.atomic():
+                Subscription.objects.bulk_create(
+                    [Subscription(user=user, author_id=pk) for pk in changed],
+                    ignore_conflicts=True)
+                add_to_followers_count(changed, 1)
+                fanned_out = [
+                    pk for pk in changed
+                    if authors[pk][1] < settings.FEED_FANOUT_MAX_FOLLOWERS
+                ]
+                if fanned_out:
+                    fill_timeline(user, Recipe.objects.filter(
+                        author__in=fanned_out))
+        else:
+            changed = [pk for pk, (subscribed, _) in authors.items()
+                       if subscribed]
+            statuses = {pk: 'not_subscribed' for pk in authors}
+            statuses.update(dict.fromkeys(changed, 'unsubscribed'))
+            with transaction.atomic():
+                user.followers.filter(author__in=changed).delete()
+                add_to_followers_count(changed, -1)
+                user.timeline.filter(recipe__author__in=changed).delete()
+        return bulk_results(ids, statuses)
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = 0
+        if recipes_limit < 1:
+            raise ValidationError(
+                {'recipes_limit': 'Должно быть целым положительным числом.'})
+        return recipes_limit
+
+    def get_subscriptions_queryset(self):
+        recipes = Recipe.objects.all()
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:recipes_limit]
+            ))
+        return User.objects.filter(authors__user=self.request.user).annotate(
+            recipes_count=Count('recipes'),
+            is_subscribed=Value(True, output_field=BooleanField()),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        ).order_by('username')
+
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
-        queryset = User.objects.filter(authors__user=request.user)
-        recipes_limit = request.query_params.get('recipes_limit')
+        queryset = self.get_subscriptions_queryset()
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = UserWithRecipesSerializer(
-                page, many=True, context={'request': request,
-                                          'recipes_limit': recipes_limit}
+                page, many=True, context={'request': request}
             )
             return self.get_paginated_response(serializer.data)
         serializer = UserWithRecipesSerializer(
-            queryset, many=True, context={'request': request,
-                                          'recipes_limit': recipes_limit})
+            queryset, many=True, context={'request': request})
         return Response(serializer.data)
 
     @action(detail=False, methods=['put', 'delete'], url_path='me/avatar',
@@ -189,20 +521,15 @@ class UserViewSet(DjoserUserViewSet):
             avatar_data = request.data.get('avatar')
             if not avatar_data:
                 raise ValidationError('Требуются данные для аватара.')
-            try:
-                format, imgstr = avatar_data.split(';base64,')
-            except ValueError:
-                raise ValidationError(
-                    'Недопустимый формат аватара. Ожидаемое - base64.')
-            ext = format.split('/')[-1]
-            avatar_file = ContentFile(base64.b64decode(imgstr),
-                                      name=f'avatar.{ext}')
+            avatar_file = decode_base64_image(avatar_data, 'avatar')
             if user.avatar:
                 user.avatar.delete(save=False)
             user.avatar = avatar_file
             user.save()
             return Response({'avatar': user.avatar.url})
         if user.avatar:
+            delete_variants(user.avatar_variants)
+            user.avatar_variants = {}
             user.avatar.delete(save=True)
         return Response(status=status.HTTP_204_NO_CONTENT)
     
@@ -252,4 +579,11 @@ class CustomAuthToken(ObtainAuthToken):
             'user_id': user.id,
             'email': user.email,
         }
-        )
\ No newline at end of file
+        )
+
+
+class TokenCacheStatsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return Response(get_token_cache().stats())
@@ -145,10 +145,10 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ],
 
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.PageToOffsetPagination',
     'PAGE_SIZE': 6,
 }
 
@@ -169,5 +169,59 @@ DJOSER = {
 
 AUTH_USER_MODEL = 'recipe.User'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recipes': {
+        'BACKEND': os.getenv(
+            'RECIPE_CACHE_BACKEND',
+            'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv(
+            'RECIPE_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'recipes')),
+        'TIMEOUT': int(os.getenv('RECIPE_CACHE_TIMEOUT', 60 * 60)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('RECIPE_CACHE_MAX_ENTRIES', 100000)),
+        },
+    },
+}
+
+PAGINATION_ESTIMATE_COUNT_THRESHOLD = int(
+    os.getenv('PAGINATION_ESTIMATE_COUNT_THRESHOLD', 0))
+
+INGREDIENT_INDEX_TTL = int(os.getenv('INGREDIENT_INDEX_TTL', 300))
+
+INGREDIENTS_CACHE_MAX_AGE = int(
+    os.getenv('INGREDIENTS_CACHE_MAX_AGE', 60 * 60 * 24))
+
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+IMAGE_UPLOAD_MAX_BYTES = int(
+    os.getenv('IMAGE_UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+
+IMAGE_UPLOAD_MAX_PIXELS = int(
+    os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 40 * 1000 * 1000))
+
+TRENDING_HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 72))
+
+SIMILARITY_INDEX_PATH = os.getenv(
+    'SIMILARITY_INDEX_PATH', os.path.join(BASE_DIR, 'cache', 'similarity.idx'))
+
+SIMILAR_RECIPES_LIMIT = int(os.getenv('SIMILAR_RECIPES_LIMIT', 6))
+
+SIMILAR_RECIPES_MAX_LIMIT = int(os.getenv('SIMILAR_RECIPES_MAX_LIMIT', 50))
+
+FEED_MAX_LENGTH = int(os.getenv('FEED_MAX_LENGTH', 500))
+
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+
+BULK_ACTION_MAX_IDS = int(os.getenv('BULK_ACTION_MAX_IDS', 100))
+
+TOKEN_CACHE_MAX_SIZE = int(os.getenv('TOKEN_CACHE_MAX_SIZE', 10000))
+
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 60))
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+DEFAULT_FILE_STORAGE = 'api.storage.HashedFileSystemStorage'
@@ -70,9 +70,9 @@ class RecipeAdmin(admin.ModelAdmin):
     def author_username(self, recipe):
         return recipe.author.username
 
-    @admin.display(description='В избранном')
+    @admin.display(description='В избранном', ordering='favorites_count')
     def get_favorite_count(self, recipe):
-        return recipe.favorites.count()
+        return recipe.favorites_count
 
     @mark_safe
     @admin.display(description='Ингредиенты')
@@ -1,20 +1,118 @@
+import csv
 import json
-from django.core.management.base import BaseCommand
+import os
+from itertools import islice
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
 from recipe.models import Ingredient
 
+READ_SIZE = 64 * 1024
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if row:
+            name, measurement_unit = row
+            yield {'name': name, 'measurement_unit': measurement_unit}
+
+
+def read_ndjson(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_json(file):
+    """Читает JSON-массив объектов по одному, не загружая файл целиком."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(',').lstrip()
+        if buffer.startswith(']'):
+            return
+        try:
+            item, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('Файл ингредиентов обрезан.')
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'ndjson': read_ndjson,
+}
+
 
 class Command(BaseCommand):
-    help = 'Загрузка ингредиентов из JSON-файла'
-
-    def handle(self, *args, **kwargs):
-        with open('ingredients.json', encoding='utf-8') as file:
-            new_ingredients = [
-                Ingredient(**item)
-                for item in json.load(file)
-            ]
-        created_ingredients = Ingredient.objects.bulk_create(
-            new_ingredients, ignore_conflicts=True)
+    help = 'Загрузка ингредиентов из CSV- или JSON-файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            default=os.path.join(settings.BASE_DIR, 'ingredients.json'),
+            help='Путь к файлу ингредиентов',
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='Формат файла; по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Число записей, загружаемых одним запросом',
+        )
+
+    def upsert(self, batch):
+        keys = {
+            (item['name'].strip(), item['measurement_unit'].strip())
+            for item in batch
+        }
+        existing = keys.intersection(Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('name', 'measurement_unit'))
+        Ingredient.objects.bulk_create(
+            [
+                Ingredient(name=name, measurement_unit=measurement_unit)
+                for name, measurement_unit in keys - existing
+            ],
+            ignore_conflicts=True,
+        )
+        return len(keys - existing), len(batch) - len(keys - existing)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        data_format = options['format'] or os.path.splitext(
+            path)[1].lstrip('.').replace('jsonl', 'ndjson')
+        if data_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла ингредиентов: {path}')
+        inserted = unchanged = 0
+        try:
+            file = open(path, encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+        with file:
+            items = READERS[data_format](file)
+            while batch := list(islice(items, options['batch_size'])):
+                batch_inserted, batch_unchanged = self.upsert(batch)
+                inserted += batch_inserted
+                unchanged += batch_unchanged
         self.stdout.write(self.style.SUCCESS(
             'Данные успешно загружены! '
-            f'Добавлено записей: {len(created_ingredients)}'
+            f'Добавлено записей: {inserted}, '
+            f'без изменений: {unchanged}'
         ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipe.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт итогов списков покупок по корзинам пользователей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить итоги с корзинами, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            stored = {
+                (totals['user_id'], totals['ingredient_id']): totals['amount']
+                for totals in ShoppingCartIngredient.objects.values(
+                    'user_id', 'ingredient_id', 'amount')
+            }
+            live = {
+                (totals['user_id'], totals['ingredient_id']): totals['amount']
+                for totals in ShoppingCartIngredient.objects.live_totals()
+            }
+            mismatches = {
+                key for key in stored.keys() | live.keys()
+                if stored.get(key) != live.get(key)
+            }
+            if mismatches:
+                raise CommandError(
+                    f'Расхождений в итогах корзин: {len(mismatches)}')
+            self.stdout.write(self.style.SUCCESS(
+                f'Итоги корзин совпадают. Записей: {len(stored)}'))
+            return
+        with transaction.atomic():
+            ShoppingCartIngredient.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            'Итоги корзин пересчитаны! '
+            f'Записей: {ShoppingCartIngredient.objects.count()}'
+        ))
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from recipe.models import Favorite, Recipe, ShoppingCart
+
+
+class Command(BaseCommand):
+    help = 'Сверка счётчиков избранного и списков покупок у рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только посчитать расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        for model in (Favorite, ShoppingCart):
+            field = model.counter_field
+            actual = Coalesce(Subquery(
+                model.objects.filter(
+                    recipe=OuterRef('pk')
+                ).values('recipe').annotate(
+                    total=Count('pk')
+                ).values('total'),
+                output_field=IntegerField(),
+            ), 0)
+            mismatched = Recipe.objects.alias(actual=actual).filter(
+                ~Q(**{field: actual}))
+            if options['check']:
+                fixed = mismatched.count()
+            else:
+                fixed = mismatched.update(**{field: actual})
+            self.stdout.write(self.style.SUCCESS(
+                f'{field}: расхождений {fixed}'))
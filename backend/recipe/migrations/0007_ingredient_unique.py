@@ -0,0 +1,53 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipe', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipe', 'RecipeIngredient')
+    ShoppingCartIngredient = apps.get_model('recipe', 'ShoppingCartIngredient')
+    duplicates = Ingredient.objects.values(
+        'name', 'measurement_unit'
+    ).annotate(
+        kept_id=models.Min('id'), total=models.Count('id')
+    ).filter(total__gt=1).order_by()
+    for duplicate in duplicates:
+        kept_id = duplicate['kept_id']
+        removed = Ingredient.objects.filter(
+            name=duplicate['name'],
+            measurement_unit=duplicate['measurement_unit'],
+        ).exclude(id=kept_id)
+        for model, owner in ((RecipeIngredient, 'recipe_id'),
+                             (ShoppingCartIngredient, 'user_id')):
+            for row in model.objects.filter(ingredient__in=removed):
+                kept_row = model.objects.filter(
+                    ingredient_id=kept_id,
+                    **{owner: getattr(row, owner)}
+                ).first()
+                if kept_row is None:
+                    row.ingredient_id = kept_id
+                    row.save(update_fields=['ingredient'])
+                else:
+                    kept_row.amount += row.amount
+                    kept_row.save(update_fields=['amount'])
+                    row.delete()
+        removed.delete()
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('recipe', '0006_storedfile'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            merge_duplicate_ingredients, migrations.RunPython.noop,
+            atomic=True),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:51
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+INGREDIENT_NAMES = (
+    "SELECT {aggregate} FROM recipe_recipeingredient ri "
+    "JOIN recipe_ingredient i ON i.id = ri.ingredient_id "
+    "WHERE ri.recipe_id = r.id"
+)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        names = INGREDIENT_NAMES.format(aggregate="string_agg(i.name, ' ')")
+        schema_editor.execute(
+            "UPDATE recipe_recipe r SET search_vector = "
+            "setweight(to_tsvector('russian', coalesce(r.name, '')), 'A') || "
+            f"setweight(to_tsvector('russian', coalesce(({names}), '')), 'B') || "
+            "setweight(to_tsvector('russian', coalesce(r.text, '')), 'C')"
+        )
+        schema_editor.execute(
+            'CREATE INDEX IF NOT EXISTS recipe_search_vector_gin '
+            'ON recipe_recipe USING gin (search_vector)'
+        )
+    elif vendor == 'sqlite':
+        names = INGREDIENT_NAMES.format(aggregate="group_concat(i.name, ' ')")
+        schema_editor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS recipe_recipe_fts USING fts5('
+            "name, ingredients, text, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        schema_editor.execute(
+            'INSERT INTO recipe_recipe_fts (rowid, name, ingredients, text) '
+            f'SELECT r.id, r.name, ({names}), r.text FROM recipe_recipe r'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS recipe_recipe_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0007_ingredient_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.16 on 2026-10-18 05:54
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipe', 'Recipe')
+    for related_name, field in (('favorites', 'favorites_count'),
+                                ('shopping_carts', 'carts_count')):
+        model = Recipe._meta.get_field(related_name).related_model
+        Recipe.objects.update(**{field: Coalesce(
+            models.Subquery(
+                model.objects.filter(
+                    recipe=models.OuterRef('pk')
+                ).values('recipe').annotate(
+                    total=models.Count('pk')
+                ).values('total'),
+                output_field=models.IntegerField(),
+            ),
+            0,
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0009_recipeingredient_ingredient_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В списках покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-id'], name='recipe_favorites_count_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import RegexValidator
 from django.db import models
+from django.db.models.functions import Greatest
 from django.core.validators import MinValueValidator
 from django.core.exceptions import ValidationError
 
@@ -48,6 +50,11 @@ class User(AbstractUser):
     )
     avatar = models.ImageField('Аватар', upload_to='users/images/',
                                null=True, blank=True)
+    avatar_variants = models.JSONField(
+        'Копии аватара', default=dict, blank=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    followers_count = models.PositiveIntegerField(
+        'Подписчики', default=0, editable=False)
 
     USERNAME_FIELD = 'email'
     USER_ID_FIELD = 'username'
@@ -101,11 +108,64 @@ class Ingredient(models.Model):
         verbose_name = 'ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        constraints = (
+            models.UniqueConstraint(
+                fields=('name', 'measurement_unit'),
+                name='unique_ingredient',
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()),
+                is_subscribed_to_author=models.Value(
+                    False, output_field=models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk'))),
+            is_subscribed_to_author=models.Exists(
+                Subscription.objects.filter(
+                    user=user, author=models.OuterRef('author'))),
+        )
+
+    def with_related(self, user):
+        if user.is_authenticated:
+            is_subscribed = models.Exists(Subscription.objects.filter(
+                user=user, author=models.OuterRef('pk')))
+        else:
+            is_subscribed = models.Value(
+                False, output_field=models.BooleanField())
+        return self.prefetch_related(
+            models.Prefetch(
+                'author',
+                queryset=User.objects.annotate(is_subscribed=is_subscribed)
+            ),
+            models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def for_feed(self, user):
+        return self.with_user_flags(user).with_related(user)
+
+    def add_to_counter(self, field, delta):
+        return self.update(**{field: Greatest(models.F(field) + delta, 0)})
+
+
 class Recipe(models.Model):
     name = models.CharField(max_length=256, verbose_name='Название',
                             help_text='Введите название рецепта')
@@ -124,6 +184,8 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Фото', help_text='Добавьте изображение рецепта'
     )
+    image_variants = models.JSONField(
+        'Копии изображения', default=dict, blank=True)
     cooking_time = models.PositiveSmallIntegerField(
         'Время приготовления',
         help_text='Введите время приготовления в минутах',
@@ -131,11 +193,28 @@ class Recipe(models.Model):
             MinValueValidator(1)
         ]
     )
+    pub_date = models.DateTimeField('Дата публикации', auto_now_add=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    search_vector = SearchVectorField(
+        'Поисковый вектор', null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False)
+    carts_count = models.PositiveIntegerField(
+        'В списках покупок', default=0, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], name='recipe_name_idx'),
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_idx'),
+            models.Index(fields=['-favorites_count', '-id'],
+                         name='recipe_favorites_count_idx'),
+        ]
 
     def __str__(self):
         return self.name
@@ -147,7 +226,7 @@ class RecipeIngredient(models.Model):
         verbose_name='Рецепт'
     )
     ingredient = models.ForeignKey(
-        Ingredient, on_delete=models.CASCADE,
+        Ingredient, on_delete=models.CASCADE, db_index=False,
         related_name='recipe_ingredients', verbose_name='Ингредиент'
     )
     amount = models.PositiveIntegerField(
@@ -167,6 +246,10 @@ class RecipeIngredient(models.Model):
                 name='unique_recipe_ingredient'
             )
         ]
+        indexes = [
+            models.Index(fields=['ingredient', 'recipe'],
+                         name='recipe_ingredient_recipe_idx'),
+        ]
 
     def __str__(self):
         return (
@@ -176,6 +259,8 @@ class RecipeIngredient(models.Model):
 
 
 class Favorite(models.Model):
+    counter_field = 'favorites_count'
+
     user = models.ForeignKey(
         User,
         related_name='favorites',
@@ -188,6 +273,8 @@ class Favorite(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = 'избранное'
@@ -205,6 +292,8 @@ class Favorite(models.Model):
 
 
 class ShoppingCart(models.Model):
+    counter_field = 'carts_count'
+
     user = models.ForeignKey(
         User,
         related_name='shopping_carts',
@@ -217,6 +306,8 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        'Дата добавления', auto_now_add=True, db_index=True)
 
     class Meta:
         verbose_name = 'корзина'
@@ -231,3 +322,198 @@ class ShoppingCart(models.Model):
 
     def __str__(self) -> str:
         return f'{self.user.username} добавил в корзину {self.recipe.name}'
+
+
+class RecipeScore(models.Model):
+    recipe = models.OneToOneField(
+        Recipe,
+        primary_key=True,
+        related_name='trending',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField('Популярность')
+    computed_at = models.DateTimeField('Дата расчёта', null=True)
+
+    class Meta:
+        verbose_name = 'популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+        indexes = [
+            models.Index(fields=['-score', '-recipe'],
+                         name='recipe_score_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id}: {self.score:.3f}'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name='timeline',
+        on_delete=models.CASCADE,
+        db_index=False,
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        related_name='timeline_entries',
+        on_delete=models.CASCADE,
+        verbose_name='Рецепт'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'запись ленты'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'recipe'),
+                name='unique_timeline_recipes',
+            ),
+        )
+        indexes = [
+            models.Index(fields=['user', '-pub_date'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.recipe_id} в ленте {self.user_id}'
+
+
+class ShoppingCartIngredientQuerySet(models.QuerySet):
+
+    def live_totals(self):
+        return RecipeIngredient.objects.filter(
+            recipe__shopping_carts__isnull=False
+        ).values(
+            'ingredient_id', user_id=models.F('recipe__shopping_carts__user')
+        ).annotate(amount=models.Sum('amount')).order_by()
+
+    def rebuild(self):
+        self.all().delete()
+        self.bulk_create(
+            ShoppingCartIngredient(**totals) for totals in self.live_totals()
+        )
+
+    def add_recipe(self, user_ids, recipe):
+        recipe_ingredients = RecipeIngredient.objects.filter(recipe=recipe)
+        user_ids = list(user_ids)
+        self.bulk_create(
+            (
+                ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=0)
+                for user_id in user_ids
+                for ingredient_id in recipe_ingredients.values_list(
+                    'ingredient', flat=True)
+            ),
+            ignore_conflicts=True
+        )
+        self.filter(
+            user__in=user_ids,
+            ingredient__in=recipe_ingredients.values('ingredient')
+        ).update(amount=models.F('amount') + models.Subquery(
+            recipe_ingredients.filter(
+                ingredient=models.OuterRef('ingredient')
+            ).values('amount')[:1]
+        ))
+
+    def remove_recipe(self, user_ids, recipe):
+        recipe_ingredients = RecipeIngredient.objects.filter(recipe=recipe)
+        user_ids = list(user_ids)
+        self.filter(
+            user__in=user_ids,
+            ingredient__in=recipe_ingredients.values('ingredient')
+        ).update(amount=Greatest(
+            models.F('amount') - models.Subquery(
+                recipe_ingredients.filter(
+                    ingredient=models.OuterRef('ingredient')
+                ).values('amount')[:1]
+            ),
+            0
+        ))
+        self.filter(user__in=user_ids, amount=0).delete()
+
+    @staticmethod
+    def recipes_amount(recipe_ingredients):
+        return models.Subquery(
+            recipe_ingredients.filter(
+                ingredient=models.OuterRef('ingredient')
+            ).values('ingredient').annotate(
+                total=models.Sum('amount')
+            ).values('total')
+        )
+
+    def add_recipes(self, user_id, recipe_ids):
+        recipe_ingredients = RecipeIngredient.objects.filter(
+            recipe__in=recipe_ids)
+        self.bulk_create(
+            (
+                ShoppingCartIngredient(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=0)
+                for ingredient_id in recipe_ingredients.values_list(
+                    'ingredient', flat=True).distinct()
+            ),
+            ignore_conflicts=True
+        )
+        self.filter(
+            user=user_id,
+            ingredient__in=recipe_ingredients.values('ingredient')
+        ).update(amount=models.F('amount') + self.recipes_amount(
+            recipe_ingredients))
+
+    def remove_recipes(self, user_id, recipe_ids):
+        recipe_ingredients = RecipeIngredient.objects.filter(
+            recipe__in=recipe_ids)
+        self.filter(
+            user=user_id,
+            ingredient__in=recipe_ingredients.values('ingredient')
+        ).update(amount=Greatest(
+            models.F('amount') - self.recipes_amount(recipe_ingredients),
+            0
+        ))
+        self.filter(user=user_id, amount=0).delete()
+
+
+class ShoppingCartIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        related_name='shopping_cart_ingredients',
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='shopping_cart_ingredients',
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество')
+
+    objects = ShoppingCartIngredientQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'ингредиент в корзине'
+        verbose_name_plural = 'Ингредиенты в корзине'
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shoppingcart_ingredient',
+            ),
+        )
+
+    def __str__(self) -> str:
+        return (f'{self.user.username}: {self.ingredient.name} — '
+                f'{self.amount} {self.ingredient.measurement_unit}')
+
+
+class StoredFile(models.Model):
+    name = models.CharField('Имя файла', max_length=255, unique=True)
+    references = models.PositiveIntegerField('Число ссылок', default=0)
+
+    class Meta:
+        verbose_name = 'файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self) -> str:
+        return f'{self.name} ({self.references})'